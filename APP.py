@@ -1,13 +1,23 @@
 import streamlit as st
 import pandas as pd
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime, timedelta
 import time
 import os
+import tempfile
 import extra_streamlit_components as stx
 import plotly.express as px
 import streamlit.components.v1 as components
+from almacen import AlmacenSheets, AlmacenSQLite, CacheHojas, FilaMovida, COL_DETALLES_VENTAS, COL_LITROS_VENTAS, COL_ESTADO_VENTAS
+from archivo import Archivo
+from bitacora import Bitacora, Sincronizador
+from detalles import texto_renglones
+from esquema import Movimiento
+from exportar import FORMATOS, exportar_zip
+from imagenes import Miniaturas
+from metricas import Metricas, medir
+from modelo import Modelo, procesar_maestros
+from resumenes import ResumenDiario
+from tanque import LibroTanque
 
 # --- 1. CONFIGURACIÓN E IDENTIDAD ---
 st.set_page_config(page_title="Agua Control", page_icon="💧", layout="wide", initial_sidebar_state="expanded")
@@ -27,23 +37,46 @@ if 'cart_counter' not in st.session_state: st.session_state.cart_counter = 0
 if 'modo_vista' not in st.session_state: st.session_state.modo_vista = "📱 Móvil (Carrusel por defecto)"
 if 'auth_status' not in st.session_state: st.session_state.auth_status = False
 if 'usuario' not in st.session_state: st.session_state.usuario = "Anon"
+if '_inicio_sesion' not in st.session_state: st.session_state._inicio_sesion = time.time()
+
+def config_app(clave, defecto=None):
+    try: return st.secrets.get("app", {}).get(clave, defecto)
+    except Exception: return defecto
+
+@st.cache_resource
+def obtener_metricas():
+    # Últimas corridas de todas las sesiones; [app] metricas_json = true las escribe también en el log
+    return Metricas(log_json=bool(config_app("metricas_json", False)))
+
+# Tiempos de este rerun por fase (se ven en PANEL ADMIN > Rendimiento)
+corrida = obtener_metricas().iniciar(st.session_state.get("_corrida"), perfilar=st.session_state.pop("perfilar_corrida", False))
+st.session_state["_corrida"] = corrida
+corrida.marcar("auth")
 
 # =====================================================================
 # MOTOR JAVASCRIPT: ACTIVA EL CARRUSEL
 # =====================================================================
 components.html("""
 <script>
+// Sin temporizador: solo se trabaja cuando Streamlit agrega nodos a la página (un rerun), una vez por cuadro
+const doc = window.parent.document;
+let pendiente = false;
 function activarCarrusel() {
-    const markers = window.parent.document.querySelectorAll('.item-catalogo-marker');
-    markers.forEach(marker => {
-        const col = marker.closest('[data-testid="column"]');
-        if (col) col.classList.add('carrusel-item');
+    pendiente = false;
+    doc.querySelectorAll('.item-catalogo-marker').forEach(marker => {
+        const col = marker.closest('[data-testid="column"], [data-testid="stColumn"]');
+        if (col && !col.classList.contains('carrusel-item')) col.classList.add('carrusel-item');
         const row = marker.closest('[data-testid="stHorizontalBlock"]');
-        if (row) row.classList.add('carrusel-movil');
+        if (row && !row.classList.contains('carrusel-movil')) row.classList.add('carrusel-movil');
     });
 }
+if (window.parent.observadorCarrusel) window.parent.observadorCarrusel.disconnect();
+window.parent.observadorCarrusel = new MutationObserver(cambios => {
+    if (pendiente) return;
+    if (cambios.some(c => [...c.addedNodes].some(n => n.nodeType === 1))) { pendiente = true; window.parent.requestAnimationFrame(activarCarrusel); }
+});
+window.parent.observadorCarrusel.observe(doc.body, { childList: true, subtree: true });
 activarCarrusel();
-setInterval(activarCarrusel, 1000);
 </script>
 """, height=0, width=0)
 
@@ -84,38 +117,44 @@ def now_vzla(): return datetime.utcnow() - timedelta(hours=4)
 # --- 2. SISTEMA DE SEGURIDAD ---
 def get_manager(): return stx.CookieManager(key="agua_manager_secure")
 
+def usuario_de_cookie(tk):
+    # Se verifica contra los secretos en cada corrida: un token revocado deja de valer sin reiniciar la app
+    try: valido = tk in st.secrets["tokens"] or tk == "admin_manual"
+    except Exception: valido = False
+    if not valido: return None
+    return "Admin" if tk == "admin_manual" else tk
+
+def iniciar_sesion(usuario, cookie, cookie_manager=None):
+    st.session_state.auth_status = True
+    st.session_state.usuario = usuario
+    st.session_state.pop("sesion_cerrada", None)
+    (cookie_manager or get_manager()).set("agua_token_secure", cookie, expires_at=now_vzla() + timedelta(days=30))
+
 def check_auth():
+    # Todo se resuelve en una sola corrida: sin esperas ni reruns para que el componente de cookies responda
     if st.session_state.auth_status and st.session_state.usuario != "Anon": 
         return True
-        
-    cookie_manager = get_manager()
-    
+
     if "token" in st.query_params or "u" in st.query_params:
         url_token = st.query_params.get("token", st.query_params.get("u", ""))
-        try:
-            if url_token in st.secrets["tokens"]:
-                st.session_state.auth_status = True
-                st.session_state.usuario = url_token
-                cookie_manager.set("agua_token_secure", url_token, expires_at=now_vzla() + timedelta(days=30))
-                st.query_params.clear()
-                time.sleep(0.5)
-                st.rerun()
-        except Exception: pass 
-
-    cookies = cookie_manager.get_all()
-    if not cookies and 'intentos_auth' not in st.session_state:
-        st.session_state['intentos_auth'] = 1
-        with st.spinner("Verificando credenciales..."): time.sleep(0.5)
-        st.rerun()
-        
-    if cookies and "agua_token_secure" in cookies:
-        tk = cookies.get("agua_token_secure")
-        try:
-            if tk in st.secrets["tokens"] or tk == "admin_manual":
-                st.session_state.auth_status = True
-                st.session_state.usuario = "Admin" if tk == "admin_manual" else tk
-                return True
-        except: pass
+        try: valido = url_token in st.secrets["tokens"]
+        except Exception: valido = False
+        if valido:
+            iniciar_sesion(url_token, url_token)  # la cookie se graba en el navegador sin recargar la página
+            st.query_params.clear()
+            return True
+
+    # La cookie llega con la propia petición (st.context.cookies); tras "Cerrar Sesión" se ignora en esta pestaña
+    tk, cookie_manager = st.context.cookies.get("agua_token_secure"), None
+    if tk and st.session_state.get("sesion_cerrada"):
+        # Se vence en vez de usar delete(): el componente aún no conoce la cookie en su primera respuesta
+        cookie_manager = get_manager(); cookie_manager.set("agua_token_secure", "", key="vencer", expires_at=now_vzla() - timedelta(days=1))
+    elif tk:
+        usuario = usuario_de_cookie(tk)
+        if usuario:
+            st.session_state.auth_status = True
+            st.session_state.usuario = usuario
+            return True
 
     c1, c2, c3 = st.columns([1,2,1])
     try:
@@ -137,9 +176,7 @@ def check_auth():
                         break
                 
                 if usuario_logeado:
-                    st.session_state.auth_status = True
-                    st.session_state.usuario = usuario_logeado
-                    cookie_manager.set("agua_token_secure", usuario_logeado, expires_at=now_vzla() + timedelta(days=30))
+                    iniciar_sesion(usuario_logeado, usuario_logeado, cookie_manager)
                     st.rerun()
                 else: st.error("❌ Clave incorrecta")
             except Exception:
@@ -150,112 +187,181 @@ if not check_auth(): st.stop()
 
 # --- 3. CONEXIÓN A DATOS OPTIMIZADA ---
 @st.cache_resource
-def obtener_conexion():
-    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-    creds = ServiceAccountCredentials.from_json_keyfile_dict(dict(st.secrets["gcp_service_account"]), scope)
-    return gspread.authorize(creds).open("Gestion_Ventas_Agua")
+def obtener_almacen():
+    # [app] almacen = "sqlite" en los secretos para trabajar con la base local, sin Google
+    if config_app("almacen", "sheets") == "sqlite":
+        almacen = AlmacenSQLite(config_app("ruta_sqlite", os.path.join(os.path.dirname(CARPETA_LOCAL), "agua_control.db")))
+    else:
+        cuota = {"lecturas_por_minuto": config_app("lecturas_por_minuto", 60), "escrituras_por_minuto": config_app("escrituras_por_minuto", 60)}
+        almacen = AlmacenSheets(dict(st.secrets["gcp_service_account"]), incremental=config_app("sync", "incremental") == "incremental", cuota=cuota)
+    almacen.preparar()
+    return almacen
+
+@st.cache_resource
+def obtener_bitacora():
+    # Cobros guardados en disco que el sincronizador todavía no subió al libro (sobreviven a un reinicio)
+    return Bitacora(config_app("ruta_bitacora", os.path.join(os.path.dirname(CARPETA_LOCAL), "bitacora_ventas.db")))
+
+@st.cache_resource
+def obtener_sincronizador():
+    return Sincronizador(obtener_bitacora(), obtener_almacen())
+
+@st.cache_resource
+def obtener_cache():
+    # Cada hoja vence a su ritmo (Productos aguanta horas, Ventas un minuto) y tiene su propio contador de versión
+    return CacheHojas(obtener_almacen(), bitacora=obtener_bitacora())
 
-@st.cache_data(ttl=60)
 def cargar_datos_maestros():
-    libro = obtener_conexion()
-    return (libro.worksheet("Productos").get_all_records(), 
-            libro.worksheet("Configuracion").get_all_records(), 
-            libro.worksheet("Cargas").get_all_records(), 
-            libro.sheet1.get_all_records(), 
-            libro.worksheet("Inventario").get_all_records())
-
-def procesar_maestros(datos_prod, datos_conf):
-    productos = {}
-    for f in datos_prod:
-        nombre = str(f.get('Producto', '')).strip()
-        if not nombre: continue
-        codigo = str(f.get('Código_SKU', f.get('Código (SKU)', f.get('Codigo', f.get('SKU', nombre))))).strip()
-        pr = float(str(f.get('Precio_Actual', 0)).replace(',', '.'))
-        l = float(str(f.get('Litros', 0)).replace(',', '.'))
-        categoria = str(f.get('Categoria', f.get('Categoría', '💧 Productos Generales'))).strip()
-        imagen = str(f.get('Imagen', f.get('imagen', ''))).strip()
-        ctrl_keys = [k for k in f.keys() if 'controla' in k.lower()]
-        controla = str(f.get(ctrl_keys[0], 'NO')).strip().upper() in ['SI', 'SÍ', 'YES', 'TRUE'] if ctrl_keys else False
-        productos[nombre] = {"precio": pr, "litros": l, "codigo": codigo, "controla_stock": controla, "categoria": categoria, "imagen": imagen}
-    tasa = 60.0
-    for c in datos_conf:
-        if str(c.get('Parametro', '')).strip() == "TASA_DIA":
-            try: tasa = float(str(c.get('Valor', 0)).replace(',', '.'))
-            except: pass
-    return productos, tasa
-
-def calcular_stock(c, v):
-    df_cargas = pd.DataFrame(c)
-    ent = pd.to_numeric(df_cargas['Litros'], errors='coerce').sum() if not df_cargas.empty and 'Litros' in df_cargas.columns else 0
-    df_ventas = pd.DataFrame(v)
-    sal = 0
-    if not df_ventas.empty and 'Total_Litros' in df_ventas.columns:
-        if len(df_ventas.columns) >= 11: 
-            estado_col = df_ventas.columns[10]
-            # Excluimos del gasto de agua los Pendientes y los ANULADOS
-            mask = ~df_ventas[estado_col].astype(str).str.contains('PENDIENTE|ANULADA', case=False, na=False)
-            sal = pd.to_numeric(df_ventas.loc[mask, 'Total_Litros'], errors='coerce').sum()
-        else:
-            sal = pd.to_numeric(df_ventas['Total_Litros'], errors='coerce').sum()
-    return ent - sal
+    # Sin copias por sesión: los registros son de solo lectura. La versión es la tupla de versiones de cada hoja
+    return obtener_cache().instantanea()
+
+def refrescar_datos(*hojas):
+    # Sin hojas = todas (botón Actualizar Datos); si no, solo vencen las nombradas
+    obtener_cache().invalidar(*hojas)
+
+def guardar_tasa(valor):
+    # Igual que guardar(): la tasa nueva queda en la copia compartida sin volver a leer Configuracion
+    with medir("escritura"): obtener_almacen().fijar_tasa(valor)
+    conf, _ = obtener_cache().leer("Configuracion")
+    pos = next((i for i, c in enumerate(conf) if str(c.get("Parametro", "")).strip() == "TASA_DIA"), None)
+    if pos is None: obtener_cache().agregar_local("Configuracion", [["TASA_DIA", valor]])
+    else: obtener_cache().cambiar_local("Configuracion", {pos: {"Valor": valor}})
+
+def guardar(hoja, filas):
+    # Escribe y agrega las filas a la copia en memoria: no hace falta volver a leer la hoja
+    with medir("escritura"): obtener_almacen().agregar(hoja, filas)
+    obtener_cache().agregar_local(hoja, filas)
+
+def nuevo_id_ticket():
+    # Único aunque dos cajeros cobren en el mismo segundo; cada fila del ticket lleva su sufijo -1, -2...
+    return now_vzla().strftime("%y%m%d%H%M%S") + "-" + os.urandom(2).hex()
+
+def guardar_venta(filas):
+    # El ticket queda en la bitácora local (sin red) y se ve ya en la copia compartida; el sincronizador lo sube por detrás
+    id_ticket = nuevo_id_ticket()
+    filas = [f + [f"{id_ticket}-{n}"] for n, f in enumerate(filas, 1)]
+    obtener_bitacora().anotar(id_ticket, filas)
+    obtener_cache().agregar_local("Ventas", filas)
+
+def modificar_ventas(cambios):
+    # {id_venta: {columna: valor}} en una sola escritura. Cada fila se ubica por su ID (sin releer la hoja)
+    # y se verifica antes de escribir; si otro cajero movió las filas, se sincroniza Ventas una vez y se reintenta.
+    # Las ventas que aún esperan en la bitácora se editan allí y suben ya editadas
+    cache = obtener_cache()
+    en_cola = obtener_bitacora().editar(cambios)
+    if en_cola:
+        try:
+            ubicadas = {i: cache.ubicar_venta(i) for i in en_cola}
+            cache.cambiar_local("Ventas", {fila - 2: {list(reg.keys())[c - 1]: v for c, v in cambios[i].items()} for i, (fila, reg) in ubicadas.items()})
+        except KeyError: cache.invalidar("Ventas")  # la próxima lectura las trae ya editadas desde la bitácora
+        cambios = {i: c for i, c in cambios.items() if i not in en_cola}
+        if not cambios: return
+    for intento in range(2):
+        try:
+            ubicadas = {i: cache.ubicar_venta(i) for i in cambios}
+            with medir("escritura"): obtener_almacen().actualizar_ventas([(fila, cambios[i], reg) for i, (fila, reg) in ubicadas.items()])
+            cache.cambiar_local("Ventas", {fila - 2: {list(reg.keys())[c - 1]: v for c, v in cambios[i].items()} for i, (fila, reg) in ubicadas.items()})
+            return
+        except (KeyError, FilaMovida):
+            if intento: raise
+            refrescar_datos("Ventas")
+
+def marcar_venta(id_venta, valor): modificar_ventas({id_venta: {COL_ESTADO_VENTAS: valor}})
+
+def registrar_entregas(entregas):
+    # entregas = [(pedido, {producto: unidades que se lleva})]. El pedido entregado completo pasa a "Entregada";
+    # en uno parcial queda pendiente solo lo que falta y lo entregado va en una fila nueva "Entregada".
+    # Un pendiente sin productos legibles (complementos viejos, textos a mano) se cierra junto con la entrega del cliente
+    cambios, nuevas = {}, []
+    ahora = now_vzla(); f_act, h_act = ahora.strftime("%Y-%m-%d"), ahora.strftime("%H:%M:%S")
+    for pedido, cant in entregas:
+        if not pedido["items"]: cambios[pedido["ID"]] = {COL_ESTADO_VENTAS: "Entregada"}; continue
+        entregado = {p: q for p, q in cant.items() if q > 0}
+        if not entregado: continue
+        resto = {p: q - cant.get(p, 0) for p, q in pedido["items"].items() if q - cant.get(p, 0) > 0}
+        if not resto: cambios[pedido["ID"]] = {COL_ESTADO_VENTAS: "Entregada"}; continue
+        r, sufijo = pedido["registro"], f" (Cliente: {pedido['cliente']})"
+        # El registro viene del DataFrame tipado: lo que falta llega como NaN y no se puede mandar a la hoja
+        try: litros_total = float(r.get("Total_Litros", 0))
+        except (TypeError, ValueError): litros_total = 0.0
+        if pd.isna(litros_total): litros_total = 0.0
+        tasa = r.get("Tasa_Cambio", "")
+        tasa = "" if tasa == "" or pd.isna(tasa) else float(tasa)
+        litros_resto = min(litros_total, sum(q * productos_disponibles.get(p, {}).get("litros", 0) for p, q in resto.items()))
+        cambios[pedido["ID"]] = {COL_DETALLES_VENTAS: texto_renglones(resto) + sufijo, COL_LITROS_VENTAS: litros_resto}
+        nuevas.append([f_act, h_act, r.get("Vendedor", ""), texto_renglones(entregado) + sufijo, 0, r.get("Moneda", "VES"),
+                       tasa, "Adelantado", f"Venta {r.get('Fecha', '')} {r.get('Hora', '')}", litros_total - litros_resto, "Entregada"])
+    # Primero las filas de lo entregado y después el recorte de los pedidos: si el recorte falla, las filas nuevas
+    # se anulan y todo queda como estaba (al revés, una falla al agregar perdía las unidades ya descontadas)
+    ids = []
+    if nuevas:
+        id_ticket = nuevo_id_ticket()
+        ids = [f"{id_ticket}-{n}" for n in range(1, len(nuevas) + 1)]
+        guardar("Ventas", [f + [i] for f, i in zip(nuevas, ids)])
+    try:
+        if cambios: modificar_ventas(cambios)
+    except Exception:
+        if ids: modificar_ventas({i: {COL_ESTADO_VENTAS: "ANULADA: entrega no registrada"} for i in ids})
+        raise
+
+@st.cache_resource
+def obtener_archivo():
+    # Meses cerrados en Parquet (python archivo.py archivar); sin carpeta, el histórico queda vacío
+    return Archivo(config_app("carpeta_archivo", os.path.join(os.path.dirname(CARPETA_LOCAL), "archivo")))
+
+def soltar_exportacion():
+    # Borra el .zip temporal de esta sesión (al reemplazarlo o después de descargarlo)
+    previa = st.session_state.pop("exportacion", None)
+    if previa:
+        try: os.remove(previa[0])
+        except OSError: pass
+
+def cargar_historico(crudos):
+    # Se lee una vez por firma del archivo (los Parquet no cambian entre reruns)
+    return obtener_archivo().historico(*procesar_maestros(crudos[0], crudos[1]))
+
+@st.cache_resource(max_entries=2)
+def obtener_resumen(firma_archivo, _historico):
+    # Totales por día compartidos por todas las sesiones; arrancan del archivo y se actualizan solo con las filas nuevas
+    return ResumenDiario(base=_historico)
+
+@st.cache_resource(max_entries=2)
+def obtener_tanque(firma_archivo, _historico):
+    # Movimientos de agua acumulados por fecha y hora, compartidos por todas las sesiones
+    return LibroTanque(inicial=_historico.tanque)
+
+@st.cache_resource(max_entries=2)
+def obtener_modelo(version, firma_archivo, _crudos, _historico):
+    # Un modelo por versión de datos, compartido por todas las sesiones: cada tabla se calcula la primera vez que una sección la pide
+    return Modelo(version, _crudos, resumen=obtener_resumen(firma_archivo, _historico), tanque=obtener_tanque(firma_archivo, _historico), historico=_historico)
 
 try:
-    d_prod, d_conf, d_cargas, d_ventas, d_inv = cargar_datos_maestros()
-    productos_disponibles, tasa_global_db = procesar_maestros(d_prod, d_conf)
-    stock = calcular_stock(d_cargas, d_ventas)
+    corrida.marcar("datos")
+    obtener_sincronizador()
+    crudos, version_datos = cargar_datos_maestros()
+    historico = cargar_historico(crudos)
+    corrida.marcar("proceso")
+    modelo = obtener_modelo(version_datos, historico.firma, crudos, historico)
+    productos_disponibles = modelo.productos
 except Exception as e:
     st.error(f"🚨 Error crítico de conexión: {e}")
     st.info("Revisa que los secretos estén bien configurados o espera 1 minuto a que se libere la cuota.")
     st.stop()
 
-st.session_state.tasa_actual = max(tasa_global_db, 1.0) 
+st.session_state.tasa_actual = modelo.tasa
 
-# --- LÓGICA DE INVENTARIO Y FILTRO GLOBAL DE ANULACIONES ---
-df_v_bruto = pd.DataFrame(d_ventas)
-if not df_v_bruto.empty and 'Monto' in df_v_bruto.columns:
-    if len(df_v_bruto.columns) >= 11:
-        # Filtro mágico: Si dice "ANULADA", la borramos de la memoria temporal para que no sume en ningún reporte
-        estado_col = df_v_bruto.columns[10]
-        df_v = df_v_bruto[~df_v_bruto[estado_col].astype(str).str.contains('ANULADA', case=False, na=False)].copy()
-    else:
-        df_v = df_v_bruto.copy()
-        
-    df_v['FechaDT'] = pd.to_datetime(df_v['Fecha'], errors='coerce') 
-    df_v['Monto'] = pd.to_numeric(df_v['Monto'], errors='coerce').fillna(0)
-else:
-    df_v = pd.DataFrame()
-
-df_c = pd.DataFrame(d_cargas)
-if not df_c.empty:
-    df_c.rename(columns={'Costo_Divisa': 'Costo_Bs', 'Notas': 'Concepto'}, inplace=True)
-    df_c['FechaDT'] = pd.to_datetime(df_c['Fecha'], errors='coerce')
-    df_c['Costo_Bs'] = pd.to_numeric(df_c['Costo_Bs'], errors='coerce').fillna(0)
-
-df_i = pd.DataFrame(d_inv)
-if not df_i.empty:
-    sku_col = next((col for col in df_i.columns if 'código' in col.lower() or 'sku' in col.lower() or 'codigo' in col.lower()), 'Item')
-    df_i.rename(columns={sku_col: 'SKU_Calc'}, inplace=True)
-    df_i['FechaDT'] = pd.to_datetime(df_i['Fecha'], errors='coerce')
-    df_i['Costo_USD'] = pd.to_numeric(df_i['Costo_Bs'], errors='coerce').fillna(0) / pd.to_numeric(df_i['Tasa_Cambio'], errors='coerce').fillna(st.session_state.tasa_actual).replace(0, 1)
-
-ventas_por_sku = {}
-sku_tapa = None
-for n, data in productos_disponibles.items():
-    ventas_por_sku[data['codigo']] = 0
-    if 'tapa' in n.lower(): sku_tapa = data['codigo']
-
-if not df_v.empty and 'Detalles_Compra' in df_v.columns:
-    for detalle in df_v['Detalles_Compra'].dropna():
-        for item in str(detalle).split(', '):
-            if 'x ' in item and 'Vuelto' not in item and 'Cliente:' not in item:
-                try:
-                    cant, nombre_venta = item.strip().split('x ', 1)
-                    if nombre_venta in productos_disponibles:
-                        sku_vendido = productos_disponibles[nombre_venta]['codigo']
-                        ventas_por_sku[sku_vendido] += int(cant)
-                        if 'botellón' in nombre_venta.lower() and 'recarga' not in nombre.lower() and sku_tapa: 
-                            ventas_por_sku[sku_tapa] += int(cant)
-                except: pass
+# Los fragmentos de DIARIO, POR ENTREGAR y el nivel del tanque corren cada AVISO_CAMBIOS segundos, solos (nunca
+# la app entera: un cobro a medio hacer no se toca) y toman lo que registró otro teléfono sin esperar el TTL
+AVISO_CAMBIOS = 5
+
+def modelo_vigente():
+    # Sin leer Sheets: mirar la versión de la copia compartida es barato; el modelo se vuelve a tomar solo si cambió
+    crudos_v, version_v = obtener_cache().instantanea(refrescar=False)
+    previo = st.session_state.get("modelo_vigente")
+    if previo is None or previo[0] != version_v:
+        st.session_state.modelo_vigente = previo = (version_v, obtener_modelo(version_v, historico.firma, crudos_v, historico))
+    return previo[1]
+corrida.marcar("menú")
 
 # =====================================================================
 # MENÚ HAMBURGUESA (SIDEBAR)
@@ -271,8 +377,11 @@ with st.sidebar:
     seleccion = st.radio("Navegación", opciones_menu, label_visibility="collapsed")
     st.markdown("<br><br><br>", unsafe_allow_html=True)
     st.divider()
-    if st.button("🔄 Actualizar Datos", use_container_width=True): st.cache_data.clear(); st.rerun()
-    if st.button("🔓 Cerrar Sesión", use_container_width=True): get_manager().delete("agua_token_secure"); st.session_state.clear(); st.query_params.clear(); time.sleep(0.5); st.rerun()
+    if st.button("🔄 Actualizar Datos", use_container_width=True): refrescar_datos(); st.rerun()
+    if st.button("🔓 Cerrar Sesión", use_container_width=True):
+        # La cookie se borra desde la pantalla de acceso (ahí el componente queda montado); sin esperas
+        st.session_state.clear(); st.session_state.sesion_cerrada = True; st.session_state._corrida = corrida
+        st.query_params.clear(); st.rerun()
 
 # =====================================================================
 # LOGO Y FRANJA GENERAL
@@ -286,23 +395,49 @@ with c2:
 vend = st.session_state.get('usuario', 'Anon').upper()
 ts = st.session_state.tasa_actual
 st.markdown(f"""<div class="info-bar"><span>👤 <b>{vend}</b></span><span>💵 Tasa: <b>{ts} Bs/$</b></span></div>""", unsafe_allow_html=True)
+atrasadas = obtener_cache().atrasadas()
+if atrasadas: st.warning(f"⚠️ Google Sheets no responde (cuota o conexión): se muestran los datos de hace {max(atrasadas.values()) / 60:.0f} min. Se reintenta solo.")
+
+# Se redibuja cada AVISO_CAMBIOS segundos mientras haya ventas en cola; vacía, basta con el próximo rerun
+@st.fragment(run_every=AVISO_CAMBIOS if obtener_bitacora().cuantas() else None)
+def frag_sincronizacion():
+    n = obtener_bitacora().cuantas()
+    if n: st.info(f"☁️ {n} {'venta' if n == 1 else 'ventas'} por sincronizar" + (f" (reintentando: {obtener_bitacora().error})" if obtener_bitacora().error else ""))
+frag_sincronizacion()
 
 # =====================================================================
 # FUNCIONES DE VENTAS Y COBRO
 # =====================================================================
+DIAS_MAPA = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
+HORAS_MAPA = list(range(9, 22))
+
+@st.cache_resource(max_entries=16)
+def figura_mapa(version, inicio, fin, _resumen):
+    # Una figura por (rango, versión de datos), armada con los acumulados por hora de cada día
+    mapa = _resumen.mapa(inicio, fin)
+    ventas = mapa[:, 0, :].astype(int)
+    total = int(ventas.sum())
+    if ventas[:, HORAS_MAPA].sum() == 0: return None, None, total
+    hm_pivot = pd.DataFrame(ventas[:, HORAS_MAPA], index=DIAS_MAPA, columns=[f"{h}:00" for h in HORAS_MAPA])
+    fig = px.imshow(hm_pivot, labels=dict(x="Hora del Día", y="Día de la Semana", color="Cantidad de Ventas"), aspect="auto", text_auto=True, color_continuous_scale="Blues")
+    fig.update_xaxes(side="top")
+    return fig, ventas[:, HORAS_MAPA].sum(axis=0), total
+
 def notificar_carrito(producto_nombre):
     st.toast(f"🛒 ¡**{producto_nombre}** actualizado en el pedido!", icon="✅")
 
-def dibujar_tarjeta(p_name, info, c_key):
-    nombre_img = str(info.get("imagen", "")).strip()
-    ruta_final_img = os.path.join(CARPETA_LOCAL, IMAGEN_POR_DEFECTO)
-    if nombre_img:
-        ruta_intento = os.path.join(CARPETA_LOCAL, nombre_img)
-        if os.path.exists(ruta_intento): ruta_final_img = ruta_intento
+@st.cache_resource
+def obtener_miniaturas(): return Miniaturas(CARPETA_LOCAL)
+
+@st.cache_resource(max_entries=2)
+def imagenes_catalogo(version_productos, _productos):
+    # Producto -> miniatura, resuelto una vez por versión de la hoja Productos y no tarjeta por tarjeta
+    return obtener_miniaturas().catalogo(_productos, IMAGEN_POR_DEFECTO)
 
+def dibujar_tarjeta(p_name, info, c_key, imagen):
     with st.container(border=True):
         st.markdown("<div class='item-catalogo-marker'></div>", unsafe_allow_html=True)
-        if os.path.exists(ruta_final_img): st.image(ruta_final_img, use_container_width=True)
+        if imagen: st.image(imagen, use_container_width=True)
         else: st.markdown("<div style='text-align:center; font-size:35px; padding:10px; height:95px;'>📦</div>", unsafe_allow_html=True)
         
         st.markdown(f"<div class='titulo-prod'>{p_name}</div>", unsafe_allow_html=True)
@@ -375,9 +510,9 @@ def modal_cobro(total_bs, total_l, items_str, cant_recarga_20l, c_key):
             elif metodo == "Mixto" and ((m1_met in ["Punto de Venta", "Pago Móvil"] and not m1_ref.strip()) or (m2_met in ["Punto de Venta", "Pago Móvil"] and not m2_ref.strip())): st.error("⚠️ Falta referencia.")
             else:
                 try:
-                    sheet_ventas_lazy = obtener_conexion().sheet1
                     f_act = now_vzla().strftime("%Y-%m-%d"); h_act = now_vzla().strftime("%H:%M:%S")
                     vend_actual = st.session_state.get('usuario', 'Admin'); ts = st.session_state.tasa_actual
+                    filas = []  # Todas las filas del ticket viajan juntas en un solo append
                     
                     if retiro_despues and total_pendientes > 0:
                         items_hoy, items_pend = [], []
@@ -394,70 +529,75 @@ def modal_cobro(total_bs, total_l, items_str, cant_recarga_20l, c_key):
                             txt_pend = f"{', '.join(items_pend)} (Cliente: {nombre_cliente})"
                             if metodo != "Mixto":
                                 mon = "USD" if "Divisa" in metodo else "VES"
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_pend, monto, mon, ts, metodo, ref or "N/A", litros_pend, "Pendiente"])
-                                if vuelto > 0: sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, f"Vuelto ({txt_pend})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
+                                filas.append([f_act, h_act, vend_actual, txt_pend, monto, mon, ts, metodo, ref or "N/A", litros_pend, "Pendiente"])
+                                if vuelto > 0: filas.append([f_act, h_act, vend_actual, f"Vuelto ({txt_pend})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
                             else:
                                 m1_mon_usd = "USD" if "Divisa" in m1_met else "VES"
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_pend, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", litros_pend, "Pendiente"])
+                                filas.append([f_act, h_act, vend_actual, txt_pend, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", litros_pend, "Pendiente"])
                                 if m2_mon > 0: 
                                     m2_mon_usd = "USD" if "Divisa" in m2_met else "VES"
-                                    sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Pendiente"])
+                                    filas.append([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Activa"])  # solo dinero: no hay nada que entregar
                         else:
                             txt_hoy = f"{', '.join(items_hoy)} (Cobro incl. Pendientes)"
                             txt_pend = f"{', '.join(items_pend)} (Cliente: {nombre_cliente})"
                             if metodo != "Mixto":
                                 mon = "USD" if "Divisa" in metodo else "VES"
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_hoy, monto, mon, ts, metodo, ref or "N/A", litros_hoy, "Activa"])
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_pend, 0, mon, ts, "Adelantado", "N/A", litros_pend, "Pendiente"])
-                                if vuelto > 0: sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, f"Vuelto ({txt_hoy})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
+                                filas.append([f_act, h_act, vend_actual, txt_hoy, monto, mon, ts, metodo, ref or "N/A", litros_hoy, "Activa"])
+                                filas.append([f_act, h_act, vend_actual, txt_pend, 0, mon, ts, "Adelantado", "N/A", litros_pend, "Pendiente"])
+                                if vuelto > 0: filas.append([f_act, h_act, vend_actual, f"Vuelto ({txt_hoy})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
                             else:
                                 m1_mon_usd = "USD" if "Divisa" in m1_met else "VES"
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_hoy, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", litros_hoy, "Activa"])
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_pend, 0, m1_mon_usd, ts, "Adelantado", "N/A", litros_pend, "Pendiente"])
+                                filas.append([f_act, h_act, vend_actual, txt_hoy, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", litros_hoy, "Activa"])
+                                filas.append([f_act, h_act, vend_actual, txt_pend, 0, m1_mon_usd, ts, "Adelantado", "N/A", litros_pend, "Pendiente"])
                                 if m2_mon > 0: 
                                     m2_mon_usd = "USD" if "Divisa" in m2_met else "VES"
-                                    sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Activa"])
+                                    filas.append([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Activa"])
                     else:
                         txt_final = ", ".join(items_str)
                         if metodo != "Mixto":
                             mon = "USD" if "Divisa" in metodo else "VES"
-                            sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_final, monto, mon, ts, metodo, ref or "N/A", total_l, "Activa"])
-                            if vuelto > 0: sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, f"Vuelto ({txt_final})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
+                            filas.append([f_act, h_act, vend_actual, txt_final, monto, mon, ts, metodo, ref or "N/A", total_l, "Activa"])
+                            if vuelto > 0: filas.append([f_act, h_act, vend_actual, f"Vuelto ({txt_final})", -vuelto, "VES", ts, "Efectivo", "Salida Caja", 0, "Activa"])
                         else:
                             m1_mon_usd = "USD" if "Divisa" in m1_met else "VES"
-                            sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, txt_final, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", total_l, "Activa"])
+                            filas.append([f_act, h_act, vend_actual, txt_final, m1_mon, m1_mon_usd, ts, m1_met, m1_ref or "N/A", total_l, "Activa"])
                             if m2_mon > 0: 
                                 m2_mon_usd = "USD" if "Divisa" in m2_met else "VES"
-                                sheet_ventas_lazy.append_row([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Activa"])
+                                filas.append([f_act, h_act, vend_actual, "Complemento Mixto", m2_mon, m2_mon_usd, ts, m2_met, m2_ref or "N/A", 0, "Activa"])
+                    guardar_venta(filas)
                     
-                    st.cache_data.clear(); st.session_state.cart_counter += 1 
-                    st.success("✅ Venta exitosa")
-                    time.sleep(1); st.rerun() 
+                    st.session_state.cart_counter += 1 
+                    st.toast("✅ Venta exitosa")
+                    st.rerun() 
                 except Exception as e: st.error(f"Error guardando venta: {e}")
 
 # =====================================================================
 # SECCIONES DEL SISTEMA
 # =====================================================================
 
+corrida.seccion = seleccion
+corrida.marcar(f"sección {seleccion}")
+
 if seleccion == "🛒 VENDER":
     with st.expander("🔄 Actualizar Tasa del Día", expanded=False):
         nueva_tasa = st.number_input("Tasa Actual (Bs/$)", value=st.session_state.tasa_actual, step=0.1, key="global_tasa")
         if st.button("💾 Guardar Tasa"):
             try:
-                ws_conf = obtener_conexion().worksheet("Configuracion")
-                cell = ws_conf.find("TASA_DIA")
-                if cell: ws_conf.update_cell(cell.row, cell.col + 1, nueva_tasa)
-                else: ws_conf.append_row(["TASA_DIA", nueva_tasa])
-                st.cache_data.clear(); st.success("¡Tasa Actualizada!"); time.sleep(1); st.rerun()
+                guardar_tasa(nueva_tasa)
+                st.success("¡Tasa Actualizada!"); time.sleep(1); st.rerun()
             except Exception as e: st.error(f"Error: {e}")
 
-    color_st = "#D32F2F" if stock < 200 else "#0078D7"
-    st.markdown(f"""
-    <div style="padding:15px; background:linear-gradient(90deg, #f8f9fa 0%, #e9ecef 100%); border-radius:12px; margin-bottom:15px; margin-top:5px; border-left:5px solid {color_st}; display:flex; justify-content:space-between; align-items:center;">
-        <div style="font-size:12px; color:#555; font-weight:bold;">TANQUE<br>DISPONIBLE</div>
-        <div style="font-size:28px; font-weight:900; color:{color_st};">{stock:,.0f} L</div>
-    </div>
-    """, unsafe_allow_html=True)
+    @st.fragment(run_every=AVISO_CAMBIOS)
+    def frag_tanque():
+        stock = modelo_vigente().stock
+        color_st = "#D32F2F" if stock < 200 else "#0078D7"
+        st.markdown(f"""
+        <div style="padding:15px; background:linear-gradient(90deg, #f8f9fa 0%, #e9ecef 100%); border-radius:12px; margin-bottom:15px; margin-top:5px; border-left:5px solid {color_st}; display:flex; justify-content:space-between; align-items:center;">
+            <div style="font-size:12px; color:#555; font-weight:bold;">TANQUE<br>DISPONIBLE</div>
+            <div style="font-size:28px; font-weight:900; color:{color_st};">{stock:,.0f} L</div>
+        </div>
+        """, unsafe_allow_html=True)
+    frag_tanque()
 
     if 'carrito' not in st.session_state: st.session_state.carrito = {}
     if not productos_disponibles:
@@ -470,6 +610,7 @@ if seleccion == "🛒 VENDER":
             categorias_dict[cat].append(nom)
 
         c_key = st.session_state.cart_counter 
+        imagenes = imagenes_catalogo(version_datos[0], productos_disponibles)
 
         for cat, prods in categorias_dict.items():
             st.markdown(f"**{cat}**")
@@ -477,14 +618,14 @@ if seleccion == "🛒 VENDER":
                 num_cols = max(len(prods), 1) 
                 cols = st.columns(num_cols)
                 for i, p_name in enumerate(prods):
-                    with cols[i]: dibujar_tarjeta(p_name, productos_disponibles[p_name], c_key)
+                    with cols[i]: dibujar_tarjeta(p_name, productos_disponibles[p_name], c_key, imagenes[p_name])
             else:
                 MAX_COLS = 4
                 for i in range(0, len(prods), MAX_COLS):
                     chunk = prods[i:i + MAX_COLS]
                     cols = st.columns(MAX_COLS) 
                     for j, p_name in enumerate(chunk):
-                        with cols[j]: dibujar_tarjeta(p_name, productos_disponibles[p_name], c_key)
+                        with cols[j]: dibujar_tarjeta(p_name, productos_disponibles[p_name], c_key, imagenes[p_name])
 
         productos_en_carrito = [p for p in productos_disponibles.keys() if st.session_state.get(f"pos_{p}_{c_key}", 0) > 0]
         if productos_en_carrito:
@@ -507,10 +648,11 @@ if seleccion == "🛒 VENDER":
                 modal_cobro(total_bs, total_l, items_str, cant_recarga_20l, c_key)
 
 elif seleccion == "🎛️ PANEL ADMIN":
+    stock, df_v, resumen = modelo.stock, modelo.df_v, modelo.resumen
     st.header("🎛️ Panel de Pruebas (Beta)")
     st.info("Estas funciones están ocultas para el resto del equipo. Son exclusivas para el Administrador.")
 
-    tab1, tab2, tab3 = st.tabs(["⚖️ Calibrar Tanque", "❌ Anular Venta", "🔐 Cierre Ciego"])
+    tab1, tab2, tab3, tab4 = st.tabs(["⚖️ Calibrar Tanque", "❌ Anular Venta", "🔐 Cierre Ciego", "⏱️ Rendimiento"])
 
     with tab1:
         st.subheader("⚖️ Calibración Rápida del Tanque")
@@ -522,16 +664,21 @@ elif seleccion == "🎛️ PANEL ADMIN":
             diferencia = nuevo_litros - stock
             if diferencia != 0:
                 try:
-                    ws_cargas = obtener_conexion().worksheet("Cargas")
                     f_act = now_vzla().strftime("%Y-%m-%d"); h_act = now_vzla().strftime("%H:%M:%S")
                     motivo = "AJUSTE/CALIBRACIÓN: Sobrante detectado" if diferencia > 0 else "MERMA/CALIBRACIÓN: Faltante de agua"
-                    ws_cargas.append_row([f_act, h_act, diferencia, 0, motivo, st.session_state.tasa_actual])
+                    guardar("Cargas", [[f_act, h_act, diferencia, 0, motivo, st.session_state.tasa_actual]])
                     st.success(f"✅ Ajuste de {diferencia:,.0f} L aplicado con éxito en la base de datos.")
-                    st.cache_data.clear(); time.sleep(1); st.rerun()
+                    time.sleep(1); st.rerun()
                 except Exception as e: st.error(e)
             else:
                 st.warning("⚠️ No hay diferencia para ajustar.")
 
+        with st.expander("🕒 ¿Cuánto marcaba el sistema en otro momento?"):
+            c_f, c_h = st.columns(2)
+            f_consulta = c_f.date_input("Fecha", value=now_vzla().date(), key="tanque_fecha")
+            h_consulta = c_h.time_input("Hora", value=now_vzla().time().replace(second=0, microsecond=0), key="tanque_hora")
+            st.metric("Litros según el Sistema a esa hora:", f"{modelo.tanque.nivel_en(datetime.combine(f_consulta, h_consulta)):,.0f} L")
+
     with tab2:
         st.subheader("❌ Anulación Lógica de Venta")
         st.write("Selecciona una venta de las últimas 48 horas para anular. El dinero se restará y el agua volverá al tanque automáticamente.")
@@ -540,10 +687,9 @@ elif seleccion == "🎛️ PANEL ADMIN":
             # Filtramos solo ventas de los ultimos 2 dias
             df_recientes = df_v[df_v['FechaDT'].dt.date >= (now_vzla().date() - timedelta(days=2))]
             if not df_recientes.empty:
-                opciones_anular = {}
-                for idx, row in df_recientes.iterrows():
-                    txt_opcion = f"{row['Fecha']} {row['Hora']} | {row['Detalles_Compra']} | Bs {row['Monto']} ({row['Metodo_Pago']})"
-                    opciones_anular[idx] = txt_opcion
+                txt_opcion = (df_recientes['Fecha'].astype(str) + " " + df_recientes['Hora'].astype(str) + " | " + df_recientes['Detalles_Compra'].astype(str)
+                              + " | Bs " + df_recientes['Monto'].astype(str) + " (" + df_recientes['Metodo_Pago'].astype(str) + ")")
+                opciones_anular = dict(zip(df_recientes['ID'], txt_opcion))
                 
                 venta_a_anular = st.selectbox("Venta a eliminar:", options=list(opciones_anular.keys()), format_func=lambda x: opciones_anular[x])
                 motivo = st.text_input("Escribe el motivo de la anulación (Ej: Error de cobro, Cliente devolvió):")
@@ -552,11 +698,9 @@ elif seleccion == "🎛️ PANEL ADMIN":
                     if not motivo.strip(): st.error("⚠️ Debes justificar el motivo de la anulación.")
                     else:
                         try:
-                            ws_v = obtener_conexion().sheet1
-                            # idx + 2 porque el indice del dataframe empieza en 0 y la primera fila es el titulo de las columnas
-                            ws_v.update_cell(venta_a_anular + 2, 11, f"ANULADA: {motivo}")
+                            marcar_venta(venta_a_anular, f"ANULADA: {motivo}")
                             st.success("✅ Venta anulada exitosamente.")
-                            st.cache_data.clear(); time.sleep(1); st.rerun()
+                            time.sleep(1); st.rerun()
                         except Exception as e: st.error(e)
             else:
                 st.info("No hay ventas activas en las últimas 48 horas.")
@@ -571,15 +715,10 @@ elif seleccion == "🎛️ PANEL ADMIN":
         conteo_punto = c3.number_input("💳 Cierre del Punto Venta", min_value=0.0, step=10.0)
         
         if st.button("🔍 Auditar Caja", use_container_width=True):
-            f_dia = now_vzla().date()
-            dia = df_v[df_v['FechaDT'].dt.date == f_dia] if not df_v.empty and 'FechaDT' in df_v.columns else pd.DataFrame()
-            
-            sis_bs = sis_usd = sis_punto = 0.0
-            if not dia.empty:
-                def s_metodo(txt): return dia[dia['Metodo_Pago'].astype(str).str.contains(txt, case=False, na=False)]['Monto'].sum()
-                sis_bs = s_metodo('Efectivo|Bs')
-                sis_usd = s_metodo('Divisa|\$')
-                sis_punto = s_metodo('Punto')
+            r_dia = resumen.dia(now_vzla().date())
+            sis_bs = r_dia.get('efectivo_monto', 0.0)
+            sis_usd = r_dia.get('divisa_monto', 0.0)
+            sis_punto = r_dia.get('punto_monto', 0.0)
                 
             dif_bs = conteo_bs - sis_bs
             dif_usd = conteo_usd - sis_usd
@@ -598,31 +737,48 @@ elif seleccion == "🎛️ PANEL ADMIN":
             k2.markdown(f"**Efectivo USD**<br>Sistema: $ {sis_usd:,.2f}<br>Caja: $ {conteo_usd:,.2f}<br>{formato_dif(dif_usd, '$')}", unsafe_allow_html=True)
             k3.markdown(f"**Punto de Venta**<br>Sistema: Bs {sis_punto:,.2f}<br>Reporte: Bs {conteo_punto:,.2f}<br>{formato_dif(dif_punto, 'Bs')}", unsafe_allow_html=True)
 
+    with tab4:
+        st.subheader("⏱️ Tiempos por Corrida")
+        st.write("Milisegundos de cada fase de las últimas corridas de la app (todas las sesiones). Las filas con sangría son parte de la fase de arriba.")
+        metricas = obtener_metricas()
+        secciones = sorted({f["seccion"] for f in list(metricas.corridas) if f["seccion"]})
+        filtro = st.selectbox("Sección:", ["Todas"] + secciones, key="metricas_seccion")
+        tabla_tiempos = metricas.resumen(None if filtro == "Todas" else filtro)
+        if tabla_tiempos: st.dataframe(pd.DataFrame(tabla_tiempos).rename(columns={"p50": "p50 (ms)", "p95": "p95 (ms)"}), hide_index=True, use_container_width=True)
+        else: st.info("Todavía no hay corridas registradas.")
+
+        if st.button("🔬 Perfilar la próxima corrida (cProfile)"): st.session_state.perfilar_corrida = True; st.rerun()
+        if metricas.perfil:
+            momento_p, seccion_p, texto_p = metricas.perfil
+            with st.expander(f"Último perfil: {seccion_p} ({momento_p:%d/%m %H:%M:%S})"): st.code(texto_p, language=None)
+
 elif seleccion == "📒 POR ENTREGAR":
     st.header("📒 Entregas Pendientes")
-    st.info("Aquí aparecen los pagos por adelantado. Al presionar 'Entregar', se descuentan los litros pendientes del tanque.")
+    st.info("Aquí aparecen los pagos por adelantado, agrupados por cliente. Ajusta cuántas unidades se lleva y presiona 'Entregar': todo se guarda de una vez y se descuentan esos litros del tanque.")
     
-    @st.fragment
+    @st.fragment(run_every=AVISO_CAMBIOS)
     def frag_pendientes():
-        if not df_v.empty and len(df_v.columns) >= 11:
-            estado_col = df_v.columns[10] 
-            df_pendientes = df_v[df_v[estado_col].astype(str).str.strip().str.upper() == 'PENDIENTE'].copy()
-            
-            if not df_pendientes.empty:
-                for idx, row in df_pendientes.iterrows():
-                    with st.container(border=True):
-                        c1, c2 = st.columns([3, 1], vertical_alignment="center")
-                        c1.markdown(f"**{row.get('Detalles_Compra', 'Pedido')}**<br><span style='color:#888; font-size:12px;'>Fecha: {row.get('Fecha', '')} | Hora: {row.get('Hora', '')}</span>", unsafe_allow_html=True)
-                        if c2.button("✅ Entregar", key=f"entregar_{idx}", use_container_width=True):
-                            try:
-                                ws = obtener_conexion().sheet1
-                                ws.update_cell(idx + 2, 11, "Entregada")
-                                st.success("¡Entrega registrada con éxito!")
-                                st.cache_data.clear(); time.sleep(1); st.rerun()
-                            except Exception as e:
-                                st.error(f"Error al actualizar: {e}")
-            else: st.success("🎉 ¡Excelente! No tienes entregas pendientes.")
-        else: st.success("🎉 ¡Excelente! No tienes entregas pendientes.")
+        pendientes = modelo_vigente().pendientes
+        if not pendientes: st.success("🎉 ¡Excelente! No tienes entregas pendientes."); return
+        buscar = st.text_input("🔎 Buscar cliente", placeholder="Nombre del cliente").strip().lower()
+        for cliente in sorted(pendientes, key=str.lower):
+            if buscar and buscar not in cliente.lower(): continue
+            pedidos = pendientes[cliente]
+            with st.form(f"entrega_{cliente}"):
+                st.markdown(f"**👤 {cliente}** <span style='color:#888; font-size:12px;'>({len(pedidos)} pedido{'s' if len(pedidos) > 1 else ''})</span>", unsafe_allow_html=True)
+                cant = {}
+                for p in pedidos:
+                    st.markdown(f"<span style='color:#888; font-size:12px;'>Fecha: {p['registro'].get('Fecha', '')} | Hora: {p['registro'].get('Hora', '')}</span>", unsafe_allow_html=True)
+                    if not p["items"]: st.caption(f"Sin productos: «{p['registro'].get('Detalles_Compra', '')}» — se marca entregado al confirmar")
+                    for prod, q in p["items"].items():
+                        cant[(p["ID"], prod)] = st.number_input(f"{prod} (pendientes: {q})", min_value=0, max_value=q, value=q, step=1, key=f"entregar_{p['ID']}_{prod}")
+                if st.form_submit_button("✅ Entregar", use_container_width=True):
+                    try:
+                        registrar_entregas([(p, {prod: cant[(p["ID"], prod)] for prod in p["items"]}) for p in pedidos])
+                        st.success("¡Entrega registrada con éxito!")
+                        time.sleep(1); st.rerun()
+                    except Exception as e:
+                        st.error(f"Error al actualizar: {e}")
     frag_pendientes()
 
 elif seleccion == "⚙️ CONFIGURACIÓN":
@@ -634,29 +790,24 @@ elif seleccion == "⚙️ CONFIGURACIÓN":
 
 elif seleccion == "📊 DIARIO":
     st.header("📊 Resumen Diario")
-    @st.fragment
+    @st.fragment(run_every=AVISO_CAMBIOS)
     def frag_diario():
+        modelo_f = modelo_vigente()
+        df_v, resumen = modelo_f.df_v, modelo_f.resumen
         f_dia = st.date_input("Fecha", now_vzla())
         if not df_v.empty and 'FechaDT' in df_v.columns:
-            dia = df_v[df_v['FechaDT'].dt.date == f_dia]
-            if not dia.empty:
-                def stats_metodo(metodo_txt):
-                    df_m = dia[dia['Metodo_Pago'].astype(str).str.contains(metodo_txt, case=False, na=False)]
-                    suma = df_m['Monto'].sum()
-                    conteo = len(df_m[~df_m['Detalles_Compra'].astype(str).str.contains('Vuelto', case=False, na=False)])
-                    return suma, conteo
-
-                movil_sum, movil_cnt = stats_metodo('Móvil|Movil')
-                efectivo_sum, efectivo_cnt = stats_metodo('Efectivo|Bs')
-                punto_sum, punto_cnt = stats_metodo('Punto')
-                divisa_sum, divisa_cnt = stats_metodo('Divisa|\$')
+            r_dia = modelo_f.totales(f_dia, f_dia)
+            if r_dia.get('registros', 0) > 0:
+                def stats_metodo(clave): return r_dia.get(f'{clave}_monto', 0.0), int(r_dia.get(f'{clave}_n', 0))
+
+                movil_sum, movil_cnt = stats_metodo('movil')
+                efectivo_sum, efectivo_cnt = stats_metodo('efectivo')
+                punto_sum, punto_cnt = stats_metodo('punto')
+                divisa_sum, divisa_cnt = stats_metodo('divisa')
                 
-                mask_bs_dia = ~dia['Metodo_Pago'].str.contains('Divisa|\$', case=False, na=False)
-                total_bs_convertidos = dia.loc[mask_bs_dia, 'Monto'].sum() / st.session_state.tasa_actual
+                total_bs_convertidos = r_dia.get('no_divisa_usd', 0.0)  # a la tasa de ese día, no a la de hoy
                 gran_total_usd = divisa_sum + total_bs_convertidos
-                
-                mask_transacciones_reales = ~dia['Detalles_Compra'].astype(str).str.contains('Complemento Mixto|Vuelto', case=False, na=False)
-                num_transacciones = len(dia[mask_transacciones_reales])
+                num_transacciones = int(r_dia.get('transacciones', 0))
                 
                 st.markdown(f"""
                 <div style='background-color: #e6f7ff; border: 2px solid #0078D7; padding: 15px; border-radius: 10px; text-align: center; margin-bottom: 20px;'>
@@ -672,18 +823,15 @@ elif seleccion == "📊 DIARIO":
                 k4.metric(f"💳 Punto ({punto_cnt} trans.)", f"Bs {punto_sum:,.2f}")
                 
                 st.divider(); st.markdown(f"#### 📦 Resumen de Productos")
-                conteo_dia = {}
-                for item in dia['Detalles_Compra'].dropna():
-                    for i in str(item).split(", "):
-                        if "x " in i and "Vuelto" not in i and "Cliente:" not in i:
-                            try: q, n = i.split("x ", 1); conteo_dia[n.strip()] = conteo_dia.get(n.strip(), 0) + int(q)
-                            except: pass
-                if conteo_dia: st.dataframe(pd.DataFrame(list(conteo_dia.items()), columns=['Producto', 'Vendidos']).sort_values(by='Vendidos', ascending=False), hide_index=True, use_container_width=True)
+                conteo_dia = resumen.unidades(f_dia, f_dia)
+                if not conteo_dia.empty: st.dataframe(conteo_dia.rename_axis('Producto').rename('Vendidos').reset_index(), hide_index=True, use_container_width=True)
+                dia = df_v.loc[df_v.index.intersection(resumen.filas(f_dia))].sort_values('HoraDT', kind='stable')  # filas cargadas a mano pueden venir fuera de orden
                 st.divider(); st.dataframe(dia[['Hora','Vendedor','Detalles_Compra','Monto','Moneda','Metodo_Pago']], hide_index=True, use_container_width=True)
             else: st.info("Sin ventas hoy.")
     frag_diario()
 
 elif seleccion == "🚛 CISTERNA":
+    df_c = modelo.df_c
     st.header("🚛 Carga de Cisterna")
     @st.fragment
     def frag_cisterna():
@@ -695,86 +843,74 @@ elif seleccion == "🚛 CISTERNA":
             n = st.text_input("Chofer / Proveedor")
             if st.form_submit_button("GUARDAR CARGA", use_container_width=True):
                 try:
-                    ws = obtener_conexion().worksheet("Cargas")
-                    ws.append_row([str(f), str(h), l, costo_bs, n, st.session_state.tasa_actual])
-                    st.cache_data.clear(); st.rerun()
+                    guardar("Cargas", [[str(f), str(h), l, costo_bs, n, st.session_state.tasa_actual]])
+                    st.rerun()
                 except Exception as e: st.error(f"Error: {e}")
         if not df_c.empty:
-            df_cisternas = df_c[~df_c['Concepto'].astype(str).str.contains('GASTO/NÓMINA|DEPÓSITO', case=False, na=False)]
+            df_cisternas = df_c[df_c['Movimiento'].isin([Movimiento.CISTERNA, Movimiento.AJUSTE])]
             if not df_cisternas.empty: st.dataframe(df_cisternas.sort_values(by=['Fecha'], ascending=False)[['Fecha', 'Litros', 'Costo_Bs', 'Concepto']], hide_index=True, use_container_width=True)
     frag_cisterna()
 
 elif seleccion == "📅 BALANCE":
+    resumen = modelo.resumen
     st.header("📅 Balance de Rendimiento")
     @st.fragment
     def frag_balance():
         fechas = st.date_input("Selecciona el rango", [now_vzla().date() - timedelta(days=7), now_vzla().date()], max_value=now_vzla().date())
         if len(fechas) == 2:
-            f_inicio_dt, f_fin_dt = pd.to_datetime(fechas[0]), pd.to_datetime(fechas[1])
-            tasa = st.session_state.tasa_actual; v_usd = 0.0; c_usd = 0.0; s_usd = 0.0; i_usd = 0.0
-            df_v_rango = pd.DataFrame()
-            if not df_v.empty and 'FechaDT' in df_v.columns:
-                df_v_rango = df_v[(df_v['FechaDT'] >= f_inicio_dt) & (df_v['FechaDT'] <= f_fin_dt)]
-                v_usd = df_v_rango[df_v_rango['Metodo_Pago'].str.contains('Divisa', case=False, na=False)]['Monto'].sum() + (df_v_rango[~df_v_rango['Metodo_Pago'].str.contains('Divisa', case=False, na=False)]['Monto'].sum() / tasa)
-            if not df_c.empty and 'FechaDT' in df_c.columns:
-                rango_c = df_c[(df_c['FechaDT'] >= f_inicio_dt) & (df_c['FechaDT'] <= f_fin_dt)]
-                mask_g = rango_c['Concepto'].str.contains('GASTO', case=False, na=False)
-                mask_d = rango_c['Concepto'].str.contains('DEPÓSITO', case=False, na=False)
-                c_usd = rango_c[~(mask_g | mask_d)]['Costo_Bs'].sum() / tasa
-                s_usd = rango_c[mask_g]['Costo_Bs'].sum() / tasa
-            if not df_i.empty and 'FechaDT' in df_i.columns:
-                i_usd = df_i[(df_i['FechaDT'] >= f_inicio_dt) & (df_i['FechaDT'] <= f_fin_dt)]['Costo_USD'].sum()
+            # Cada día convertido a su propia tasa (Modelo.dias), no todo el rango a la de hoy
+            r_rango = modelo.totales(fechas[0], fechas[1])
+            v_usd = r_rango.get('ventas_usd', 0.0)
+            c_usd = r_rango.get('agua_usd', 0.0)
+            s_usd = r_rango.get('gasto_usd', 0.0)
+            i_usd = r_rango.get('inventario_usd', 0.0)
             
             c1, c2, c3, c4 = st.columns(4)
             c1.metric("Ingresos (+)", f"$ {v_usd:,.2f}"); c2.metric("Agua (-)", f"$ {c_usd:,.2f}"); c3.metric("Gastos (-)", f"$ {(s_usd + i_usd):,.2f}"); c4.metric("UTILIDAD", f"$ {(v_usd - c_usd - s_usd - i_usd):,.2f}")
             
             st.divider()
             st.markdown("#### 📦 Resumen de Productos Vendidos")
-            if not df_v_rango.empty:
-                conteo = {}
-                for item in df_v_rango['Detalles_Compra'].dropna():
-                    for i in str(item).split(", "):
-                        if "x " in i and "Vuelto" not in i and "Cliente:" not in i:
-                            try: q, n = i.split("x ", 1); conteo[n.strip()] = conteo.get(n.strip(), 0) + int(q)
-                            except: pass
-                if conteo:
-                    df_conteo = pd.DataFrame(list(conteo.items()), columns=['Producto', 'Cantidad Vendida']).sort_values(by='Cantidad Vendida', ascending=False)
-                    st.dataframe(df_conteo, hide_index=True, use_container_width=True)
+            if r_rango.get('registros', 0) > 0:
+                conteo = resumen.unidades(fechas[0], fechas[1])
+                if not conteo.empty:
+                    st.dataframe(conteo.rename_axis('Producto').rename('Cantidad Vendida').reset_index(), hide_index=True, use_container_width=True)
                 else: st.info("No hay productos detallados en este rango.")
+
+            with st.expander("📤 Exportar para contabilidad"):
+                # Ventas (con renglones), Cargas e Inventario del rango, archivo incluido, escritos por tramos en un .zip
+                formato = st.radio("Formato", FORMATOS, horizontal=True, key="formato_export")
+                if st.button("Preparar exportación", use_container_width=True):
+                    with st.spinner("Exportando..."):
+                        vivas = {"Ventas": modelo.d_ventas, "Cargas": modelo.d_cargas, "Inventario": modelo.d_inv}
+                        soltar_exportacion()
+                        # Un .zip propio de esta sesión en disco; en la sesión solo queda su ruta
+                        with tempfile.NamedTemporaryFile(prefix="agua_export_", suffix=".zip", delete=False) as destino:
+                            filas = exportar_zip(obtener_archivo(), vivas, productos_disponibles, fechas[0], fechas[1], destino, formato)
+                        st.session_state.exportacion = (destino.name, f"agua_{fechas[0]:%Y%m%d}_{fechas[1]:%Y%m%d}_{formato}.zip", filas)
+                if st.session_state.get("exportacion") and os.path.exists(st.session_state.exportacion[0]):
+                    ruta, nombre, filas = st.session_state.exportacion
+                    st.caption(" · ".join(f"{n}: {q:,} filas" for n, q in filas.items()))
+                    with open(ruta, "rb") as f:
+                        st.download_button("⬇️ Descargar", f, file_name=nombre, mime="application/zip", use_container_width=True, on_click=soltar_exportacion)
     frag_balance()
 
 elif seleccion == "🏦 CAJA GENERAL":
+    df_v = modelo.df_v
     st.header("🏦 Caja General")
     @st.fragment
     def frag_caja():
         caja_total_usd = 0.0; ventas_totales_usd = 0.0; total_litros_historicos = 0
         if not df_v.empty:
-            divisa_tot = df_v[df_v['Metodo_Pago'].astype(str).str.contains('Divisa|\$', case=False, na=False)]['Monto'].sum()
-            bs_tot_ingresos = df_v[~df_v['Metodo_Pago'].astype(str).str.contains('Divisa|\$', case=False, na=False)]['Monto'].sum()
-            ventas_totales_usd = divisa_tot + (bs_tot_ingresos / st.session_state.tasa_actual)
-            
-            if len(df_v.columns) >= 11:
-                mask = df_v[df_v.columns[10]].astype(str).str.strip().str.upper() != 'PENDIENTE'
-                total_litros_historicos = pd.to_numeric(df_v.loc[mask, 'Total_Litros'], errors='coerce').sum()
-            else:
-                total_litros_historicos = pd.to_numeric(df_v['Total_Litros'], errors='coerce').sum()
-
-            bs_tot_egresos = df_c[~df_c['Concepto'].astype(str).str.contains('DEPÓSITO', case=False, na=False)]['Costo_Bs'].sum() if not df_c.empty else 0.0
-            bs_tot_inventario_usd = df_i['Costo_USD'].sum() if not df_i.empty else 0.0
-            caja_total_usd = ventas_totales_usd - (bs_tot_egresos / st.session_state.tasa_actual) - bs_tot_inventario_usd
+            r_total = modelo.totales()
+            ventas_totales_usd = r_total.get('ventas_usd', 0.0)
+            total_litros_historicos = r_total.get('litros_vendidos', 0.0)
+            egresos_usd = r_total.get('agua_usd', 0.0) + r_total.get('gasto_usd', 0.0)
+            bs_tot_inventario_usd = r_total.get('inventario_usd', 0.0)
+            caja_total_usd = ventas_totales_usd - egresos_usd - bs_tot_inventario_usd
         st.markdown(f"<div style='background-color: #e6f7ff; border: 2px solid #0078D7; padding: 15px; border-radius: 10px; text-align: center; margin-bottom: 20px;'><h3>Caja Total Histórica: $ {caja_total_usd:,.2f}</h3></div>", unsafe_allow_html=True)
         
         st.divider(); st.subheader("💧 Análisis del Valor del Agua")
-        costo_litro_usd = 0.0
-        if not df_c.empty:
-            mask_cisternas = ~df_c['Concepto'].astype(str).str.contains('GASTO/NÓMINA|DEPÓSITO', case=False, na=False)
-            df_solo_cisternas = df_c[mask_cisternas]
-            if not df_solo_cisternas.empty:
-                ultima_cist = df_solo_cisternas.sort_values(by=['Fecha'], ascending=False).iloc[0]
-                l_uc = pd.to_numeric(ultima_cist['Litros']); bs_uc = pd.to_numeric(ultima_cist['Costo_Bs'])
-                tasa_uc = pd.to_numeric(ultima_cist.get('Tasa_Cambio', st.session_state.tasa_actual))
-                if pd.isna(tasa_uc) or tasa_uc <= 0: tasa_uc = st.session_state.tasa_actual
-                if l_uc > 0: costo_litro_usd = (bs_uc / tasa_uc) / l_uc
+        costo_litro_usd = modelo.costo_litro
         promedio_venta_litro_usd = (ventas_totales_usd / total_litros_historicos) if total_litros_historicos > 0 else 0.0
         c1, c2 = st.columns(2)
         c1.metric("Costo por Litro (Última Cisterna)", f"$ {costo_litro_usd:,.4f}")
@@ -784,29 +920,14 @@ elif seleccion == "🏦 CAJA GENERAL":
         st.divider(); st.subheader("💡 Sugerencia de Precios (Punto de Equilibrio)")
         datos_sugeridos = []
         for nombre, data in productos_disponibles.items():
-            costo_base = 0.0
-            if data['litros'] > 0: costo_base += (data['litros'] * costo_litro_usd)
-            sku = data['codigo']
-            if 'botellón' in nombre.lower() and 'recarga' not in nombre.lower():
-                if not df_i.empty and 'SKU_Calc' in df_i.columns:
-                    df_b = df_i[df_i['SKU_Calc'].astype(str).str.strip() == sku]
-                    cant_b = df_b['Cantidad'].sum()
-                    if cant_b > 0: costo_base += (df_b['Costo_USD'].sum() / cant_b)
-                if sku_tapa and not df_i.empty and 'SKU_Calc' in df_i.columns:
-                    df_t = df_i[df_i['SKU_Calc'].astype(str).str.strip() == sku_tapa]
-                    cant_t = df_t['Cantidad'].sum()
-                    if cant_t > 0: costo_base += (df_t['Costo_USD'].sum() / cant_t)
-            elif 'tapa' in nombre.lower():
-                if not df_i.empty and 'SKU_Calc' in df_i.columns:
-                    df_t = df_i[df_i['SKU_Calc'].astype(str).str.strip() == sku]
-                    cant_t = df_t['Cantidad'].sum()
-                    if cant_t > 0: costo_base += (df_t['Costo_USD'].sum() / cant_t)
+            costo_base = modelo.costo_productos.get(nombre, 0.0)
             precio_actual_usd = data['precio'] / st.session_state.tasa_actual
             datos_sugeridos.append({"Producto": nombre, "Costo Real ($)": f"${costo_base:.3f}", "Tu Precio Hoy ($)": f"${precio_actual_usd:.2f}", "Sugerido (+30%)": f"${(costo_base * 1.30):.2f}", "Sugerido (+50%)": f"${(costo_base * 1.50):.2f}"})
         if datos_sugeridos: st.dataframe(pd.DataFrame(datos_sugeridos), hide_index=True, use_container_width=True)
     frag_caja()
 
 elif seleccion == "📦 INVENTARIO":
+    costos = modelo.costos.to_dict("index")
     st.header("📦 Gestión de Insumos")
     @st.fragment
     def frag_inv():
@@ -822,11 +943,10 @@ elif seleccion == "📦 INVENTARIO":
                 costo_compra = c4.number_input("Costo TOTAL Pagado", min_value=0.0, step=1.0)
                 if st.form_submit_button("Guardar Compra", use_container_width=True):
                     try:
-                        ws = obtener_conexion().worksheet("Inventario")
                         h_act = now_vzla().strftime("%H:%M:%S"); f_act = now_vzla().strftime("%Y-%m-%d"); tasa_hoy = st.session_state.tasa_actual
                         monto_guardar_bs = costo_compra * tasa_hoy if "Divisas" in moneda_compra else costo_compra
-                        ws.append_row([str(f_act), str(h_act), sku_seleccionado, cant_compra, monto_guardar_bs, st.session_state.tasa_actual])
-                        st.cache_data.clear(); st.rerun()
+                        guardar("Inventario", [[str(f_act), str(h_act), sku_seleccionado, cant_compra, monto_guardar_bs, st.session_state.tasa_actual]])
+                        st.rerun()
                     except Exception as e: st.error(f"Error: {e}")
             else: st.warning("⚠️ No hay productos marcados con 'SI' en Controla_Stock.")
         
@@ -834,16 +954,12 @@ elif seleccion == "📦 INVENTARIO":
         datos_maestros = []
         for nombre, data in productos_disponibles.items():
             if data['controla_stock']:
-                sku = data['codigo']; cant_comprada = 0; costo_total_usd = 0.0
-                if not df_i.empty and 'SKU_Calc' in df_i.columns:
-                    df_filtro = df_i[df_i['SKU_Calc'].astype(str).str.strip() == sku]
-                    cant_comprada = df_filtro['Cantidad'].sum()
-                    costo_total_usd = df_filtro['Costo_USD'].sum()
-                cant_vendida = ventas_por_sku.get(sku, 0); stock_actual = cant_comprada - cant_vendida
-                costo_unitario_usd = (costo_total_usd / cant_comprada) if cant_comprada > 0 else 0.0
+                sku = data['codigo']; c = costos.get(sku, {})
+                costo_unitario_usd = c.get('Costo_Promedio_USD', 0.0)
                 precio_venta_usd = data['precio'] / st.session_state.tasa_actual
                 margen = f"{((precio_venta_usd - costo_unitario_usd) / costo_unitario_usd) * 100:.0f}%" if costo_unitario_usd > 0 and precio_venta_usd > 0 else "N/A"
-                datos_maestros.append({"SKU": sku, "Producto": nombre, "Stock Real": stock_actual, "Costo c/u ($)": f"${costo_unitario_usd:.3f}", "Precio Venta ($)": f"${precio_venta_usd:.2f}", "Margen": margen})
+                datos_maestros.append({"SKU": sku, "Producto": nombre, "Stock Real": int(c.get('Stock', 0)), "Costo c/u ($)": f"${costo_unitario_usd:.3f}",
+                                       "Costo FIFO ($)": f"${c.get('Costo_FIFO_USD', 0.0):.3f}", "Precio Venta ($)": f"${precio_venta_usd:.2f}", "Margen": margen})
         if datos_maestros: st.dataframe(pd.DataFrame(datos_maestros), hide_index=True, use_container_width=True)
     frag_inv()
 
@@ -858,10 +974,9 @@ elif seleccion == "💸 NÓMINA":
             monto_gasto = c3.number_input("Monto Numérico", min_value=0.0, step=1.0)
             if st.form_submit_button("REGISTRAR GASTO", use_container_width=True) and monto_gasto > 0:
                 try:
-                    ws = obtener_conexion().worksheet("Cargas")
                     monto_guardar_bs = monto_gasto * st.session_state.tasa_actual if "Divisas" in moneda_gasto else monto_gasto
-                    ws.append_row([now_vzla().strftime("%Y-%m-%d"), now_vzla().strftime("%H:%M:%S"), 0, monto_guardar_bs, f"GASTO/NÓMINA: {concepto}", st.session_state.tasa_actual])
-                    st.cache_data.clear(); st.rerun()
+                    guardar("Cargas", [[now_vzla().strftime("%Y-%m-%d"), now_vzla().strftime("%H:%M:%S"), 0, monto_guardar_bs, f"GASTO/NÓMINA: {concepto}", st.session_state.tasa_actual]])
+                    st.rerun()
                 except Exception as e: st.error(f"Error: {e}")
     frag_nom()
 
@@ -878,60 +993,39 @@ elif seleccion == "🏧 DEPÓSITOS":
             monto_dep = c4.number_input("Monto Depositado", min_value=0.0, step=1.0)
             if st.form_submit_button("REGISTRAR MOVIMIENTO", use_container_width=True) and monto_dep > 0:
                 try:
-                    ws = obtener_conexion().worksheet("Cargas")
                     monto_guardar_bs = monto_dep * st.session_state.tasa_actual if "Divisas" in moneda_dep else monto_dep
-                    ws.append_row([now_vzla().strftime("%Y-%m-%d"), now_vzla().strftime("%H:%M:%S"), 0, monto_guardar_bs, f"DEPÓSITO: {tipo_entrada} (Ref: {ref_dep})", st.session_state.tasa_actual])
-                    st.cache_data.clear(); st.rerun()
+                    guardar("Cargas", [[now_vzla().strftime("%Y-%m-%d"), now_vzla().strftime("%H:%M:%S"), 0, monto_guardar_bs, f"DEPÓSITO: {tipo_entrada} (Ref: {ref_dep})", st.session_state.tasa_actual]])
+                    st.rerun()
                 except Exception as e: st.error(f"Error: {e}")
     frag_dep()
 
 elif seleccion == "📈 MAPA DE CALOR":
+    resumen = modelo.resumen
     st.header("📈 Horario Comercial de Ventas")
     @st.fragment
     def frag_mapa():
         opcion_filtro = st.radio("Selecciona los datos a analizar:", ["Historial Completo", "Por Rango de Fechas"], horizontal=True)
         fechas_hm = st.date_input("Rango", [now_vzla().date() - timedelta(days=7), now_vzla().date()], max_value=now_vzla().date()) if opcion_filtro == "Por Rango de Fechas" else None
-        
-        if not df_v.empty and 'Hora' in df_v.columns and 'Fecha' in df_v.columns:
-            df_hm = df_v.copy()
-            if fechas_hm is not None and len(fechas_hm) == 2:
-                df_hm['Fecha_Date'] = pd.to_datetime(df_hm['Fecha'], errors='coerce').dt.date
-                df_hm = df_hm[(df_hm['Fecha_Date'] >= fechas_hm[0]) & (df_hm['Fecha_Date'] <= fechas_hm[1])]
+        inicio, fin = (fechas_hm[0], fechas_hm[1]) if fechas_hm is not None and len(fechas_hm) == 2 else (None, None)
+
+        fig, por_hora, total = figura_mapa(version_datos, inicio, fin, resumen)
+        if total == 0: st.warning("Sin ventas en este rango.")
+        elif fig is None: st.warning("No hay ventas entre 9 AM y 9 PM.")
+        else:
+            st.plotly_chart(fig, use_container_width=True)
             
-            if not df_hm.empty:
-                df_hm['FechaDT'] = pd.to_datetime(df_hm['Fecha'].astype(str) + ' ' + df_hm['Hora'], errors='coerce')
-                df_hm = df_hm.dropna(subset=['FechaDT'])
-                if not df_hm.empty:
-                    df_hm['Hora_Int'] = df_hm['FechaDT'].dt.hour
-                    df_hm = df_hm[(df_hm['Hora_Int'] >= 9) & (df_hm['Hora_Int'] <= 21)]
-                    if not df_hm.empty:
-                        df_hm['Dia'] = df_hm['FechaDT'].dt.day_name()
-                        dias_es = {'Monday':'Lunes', 'Tuesday':'Martes', 'Wednesday':'Miércoles', 'Thursday':'Jueves', 'Friday':'Viernes', 'Saturday':'Sábado', 'Sunday':'Domingo'}
-                        df_hm['Dia'] = df_hm['Dia'].map(dias_es)
-                        
-                        hm_grouped = df_hm.groupby(['Dia', 'Hora_Int']).size().reset_index(name='Ventas')
-                        hm_pivot = hm_grouped.pivot(index='Dia', columns='Hora_Int', values='Ventas').fillna(0)
-                        
-                        dias_orden = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-                        horas_orden = list(range(9, 22))
-                        hm_pivot = hm_pivot.reindex(index=dias_orden, columns=horas_orden, fill_value=0)
-                        horas_str = [f"{h}:00" for h in horas_orden]
-                        
-                        fig = px.imshow(hm_pivot, labels=dict(x="Hora del Día", y="Día de la Semana", color="Cantidad de Ventas"), x=horas_str, y=dias_orden, aspect="auto", text_auto=True, color_continuous_scale="Blues")
-                        fig.update_xaxes(side="top")
-                        st.plotly_chart(fig, use_container_width=True)
-                        
-                        st.divider(); st.markdown("#### ⏱️ Resumen de Tráfico")
-                        resumen_horas = df_hm.groupby('Hora_Int').size().reindex(horas_orden, fill_value=0).reset_index(name='Total_Ventas')
-                        idx_max = resumen_horas['Total_Ventas'].idxmax()
-                        idx_min = resumen_horas['Total_Ventas'].idxmin()
-                        
-                        def formato_hora(h): return f"{h if h <= 12 else h - 12}:00 {'AM' if h < 12 else 'PM'}"
-                        
-                        c1, c2 = st.columns(2)
-                        c1.success(f"🔥 **Mayor Tráfico:** {formato_hora(int(resumen_horas.loc[idx_max, 'Hora_Int']))}\n\nAcumulando **{int(resumen_horas.loc[idx_max, 'Total_Ventas'])} transacciones**.")
-                        c2.warning(f"🧊 **Menor Tráfico:** {formato_hora(int(resumen_horas.loc[idx_min, 'Hora_Int']))}\n\nCon solo **{int(resumen_horas.loc[idx_min, 'Total_Ventas'])} transacciones**.")
-                    else: st.warning("No hay ventas entre 9 AM y 9 PM.")
-                else: st.warning("Fechas inválidas.")
-            else: st.warning("Sin ventas en este rango.")
+            st.divider(); st.markdown("#### ⏱️ Resumen de Tráfico")
+            h_max, h_min = HORAS_MAPA[int(por_hora.argmax())], HORAS_MAPA[int(por_hora.argmin())]
+            
+            def formato_hora(h): return f"{h if h <= 12 else h - 12}:00 {'AM' if h < 12 else 'PM'}"
+            
+            c1, c2 = st.columns(2)
+            c1.success(f"🔥 **Mayor Tráfico:** {formato_hora(h_max)}\n\nAcumulando **{int(por_hora.max())} transacciones**.")
+            c2.warning(f"🧊 **Menor Tráfico:** {formato_hora(h_min)}\n\nCon solo **{int(por_hora.min())} transacciones**.")
     frag_mapa()
+
+if not st.session_state.get("_pantalla_lista"):
+    # Desde la primera corrida de la sesión (acceso incluido) hasta la primera pantalla completa
+    st.session_state._pantalla_lista = True
+    corrida.detalle["primera pantalla"] = (time.time() - st.session_state._inicio_sesion) * 1000
+obtener_metricas().terminar(corrida)
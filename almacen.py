@@ -0,0 +1,421 @@
+"""Motores de almacenamiento de Agua Control.
+
+La app solo habla con la interfaz Almacen; debajo puede haber el libro de
+Google Sheets de siempre (AlmacenSheets) o un archivo SQLite local
+(AlmacenSQLite) para trabajar sin depender de Google.
+
+Uso por consola (copiar el libro de Sheets a SQLite):
+    python almacen.py copiar agua_control.db
+"""
+import itertools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import ExitStack
+
+from metricas import medir
+
+HOJAS = ("Productos", "Configuracion", "Cargas", "Ventas", "Inventario")
+
+# Encabezados con los que se crean las tablas de un SQLite vacío (mismo orden que las hojas)
+ENCABEZADOS = {
+    "Productos": ["Producto", "Código_SKU", "Precio_Actual", "Litros", "Categoria", "Imagen", "Controla_Stock"],
+    "Configuracion": ["Parametro", "Valor"],
+    "Cargas": ["Fecha", "Hora", "Litros", "Costo_Divisa", "Notas", "Tasa_Cambio"],
+    "Ventas": ["Fecha", "Hora", "Vendedor", "Detalles_Compra", "Monto", "Moneda", "Tasa_Cambio", "Metodo_Pago", "Referencia", "Total_Litros", "Estado", "ID_Venta"],
+    "Inventario": ["Fecha", "Hora", "Código_SKU", "Cantidad", "Costo_Bs", "Tasa_Cambio"],
+}
+COL_DETALLES_VENTAS = 4  # Columna D
+COL_LITROS_VENTAS = 10  # Columna J
+COL_ESTADO_VENTAS = 11  # Columna K
+COL_ID_VENTAS = 12  # Columna L
+
+# Segundos que cada hoja se sirve desde memoria antes de volver a consultarla
+TTL_HOJAS = {"Productos": 6 * 3600, "Configuracion": 300, "Cargas": 60, "Ventas": 60, "Inventario": 300}
+REINTENTO_LECTURA = 15  # si una lectura falla se sigue con la copia vieja y se vuelve a probar a los 15 s
+_VERSIONES = itertools.count(1)
+
+
+class FilaMovida(Exception):
+    # La fila de la hoja ya no es la venta que se quería modificar
+    pass
+
+
+def id_venta(registro, posicion):
+    # Las ventas viejas no tienen ID: se identifican por su fila (no se borran filas de Ventas)
+    return str(registro.get("ID_Venta", "")).strip() or f"F{posicion + 2}"
+
+
+def _clave_venta(registro):
+    return (registro.get("Fecha"), registro.get("Hora"), registro.get("Detalles_Compra"), registro.get("ID_Venta"))
+
+
+def _misma_venta(valores, esperado):
+    # Compara Fecha, Hora, Detalles_Compra e ID de la fila leída contra el registro en memoria
+    esp = list(esperado.values())
+    return all(str(valores[i] if i < len(valores) else "").strip() == str(esp[i] if i < len(esp) else "").strip()
+               for i in (0, 1, 3, COL_ID_VENTAS - 1))
+
+
+class Almacen(ABC):
+    def preparar(self):
+        # Ajustes de estructura al arrancar (p. ej. la columna ID_Venta en hojas viejas)
+        pass
+
+    @abstractmethod
+    def leer(self, hoja):
+        pass
+
+    def leer_varias(self, hojas):
+        # {hoja: registros}. Por defecto una tras otra; AlmacenSheets las pide todas en una sola llamada
+        leidas = {}
+        for h in hojas:
+            with medir(f"hoja {h}"): leidas[h] = self.leer(h)
+        return leidas
+
+    @abstractmethod
+    def agregar(self, hoja, filas):
+        pass
+
+    @abstractmethod
+    def actualizar_ventas(self, cambios):
+        # cambios = [(fila, {columna 1-based: valor}, esperado)], todo en una sola escritura.
+        # fila = número de fila de la hoja (la 1 son los títulos, la primera venta es la 2).
+        # Con `esperado` (el registro en memoria) se lee la fila antes de escribir y, si alguna
+        # no es la misma venta, se lanza FilaMovida sin tocar nada
+        pass
+
+    @abstractmethod
+    def fijar_tasa(self, valor):
+        pass
+
+    @abstractmethod
+    def recortar(self, hoja, n, conservar=()):
+        # Borra las primeras n filas de datos (ya archivadas) salvo las posiciones de `conservar`; las demás suben
+        pass
+
+
+# =====================================================================
+# GOOGLE SHEETS
+# =====================================================================
+class AlmacenSheets(Almacen):
+    def __init__(self, credenciales, libro="Gestion_Ventas_Agua", incremental=True, cuota=None):
+        # gspread (y lo que cuelga de él) solo hace falta con este motor: AlmacenSQLite funciona sin instalarlo
+        import gspread
+        from oauth2client.service_account import ServiceAccountCredentials
+
+        from cuota import ClienteCuota
+        from sincronizacion import EspejoHoja
+        scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+        creds = ServiceAccountCredentials.from_json_keyfile_dict(credenciales, scope)
+        self.libro = gspread.authorize(creds).open(libro)
+        # Toda llamada a la API pasa por HTTPClient.request: ahí se limita a la cuota, se reintenta y se cuenta
+        ClienteCuota(self.libro.client, **(cuota or {}))
+        self._hojas = {}
+        self._lock = threading.Lock()
+        # Copias locales de las hojas que crecen: en cada refresco solo viajan las filas nuevas
+        self.espejos = {"Cargas": EspejoHoja("Cargas"), "Ventas": EspejoHoja("Ventas", col_estado=COL_ESTADO_VENTAS),
+                        "Inventario": EspejoHoja("Inventario")} if incremental else {}
+
+    def preparar(self):
+        ws = self.hoja("Ventas")
+        enc = ws.row_values(1)
+        if len(enc) < COL_ID_VENTAS or not enc[COL_ID_VENTAS - 1]: ws.update_cell(1, COL_ID_VENTAS, "ID_Venta")
+
+    def hoja(self, nombre):
+        with self._lock:
+            if not self._hojas:
+                # Una sola lectura de metadatos para todas las pestañas (Ventas es la primera)
+                todas = self.libro.worksheets()
+                self._hojas = {ws.title: ws for ws in todas}
+                if todas: self._hojas["Ventas"] = todas[0]
+            if nombre not in self._hojas:
+                self._hojas[nombre] = self.libro.sheet1 if nombre == "Ventas" else self.libro.worksheet(nombre)
+            return self._hojas[nombre]
+
+    def leer(self, hoja):
+        ws = self.hoja(hoja)
+        if hoja in self.espejos: return self.espejos[hoja].sincronizar(ws)
+        return ws.get_all_records()
+
+    def leer_varias(self, hojas):
+        # Un solo values:batchGet para todas: completas las hojas sin espejo (o con el espejo por recargar)
+        # y solo la cola más la columna de estado las que tienen espejo. El tiempo de la llamada queda en
+        # "lote Sheets" y el de armar cada hoja en "hoja <nombre>"
+        from gspread.utils import absolute_range_name, fill_gaps, numericise_all, to_records
+        hojas = list(hojas)
+        with ExitStack() as candados:
+            pedidos = []  # (hoja, rangos del espejo o None = hoja completa)
+            for h in hojas:
+                espejo = self.espejos.get(h)
+                if espejo: candados.enter_context(espejo.lock)
+                pedidos.append((h, espejo.rangos() if espejo else None))
+            rangos = [absolute_range_name(self.hoja(h).title, r) for h, rs in pedidos for r in (rs or [None])]
+            with medir("lote Sheets"): respuesta = self.libro.values_batch_get(rangos).get("valueRanges", [])
+            partes = iter([vr.get("values", []) for vr in respuesta])
+
+            leidas = {}
+            for h, rs in pedidos:
+                with medir(f"hoja {h}"):
+                    espejo = self.espejos.get(h)
+                    if rs is None:
+                        valores = fill_gaps(next(partes) or [[]])  # igual que get_all_values()
+                        if espejo: espejo.completo(valores); leidas[h] = espejo.registros()
+                        else: leidas[h] = [] if valores == [[]] else to_records(valores[0], [numericise_all(f) for f in valores[1:]])
+                    else:
+                        if not espejo.aplicar([next(partes) for _ in rs]): espejo.completo(self.hoja(h).get_all_values())
+                        leidas[h] = espejo.registros()
+            return leidas
+
+    def agregar(self, hoja, filas):
+        if filas: self.hoja(hoja).append_rows(filas)
+
+    def actualizar_ventas(self, cambios):
+        from sincronizacion import letra_columna
+        if not cambios: return
+        ws = self.hoja("Ventas")
+        a_verificar = [(f, e) for f, _, e in cambios if e is not None]
+        if a_verificar:
+            ultima = letra_columna(COL_ID_VENTAS)
+            leidas = ws.batch_get([f"A{f}:{ultima}{f}" for f, _ in a_verificar])
+            for (f, e), valores in zip(a_verificar, leidas):
+                if not _misma_venta(valores[0] if valores else [], e): raise FilaMovida(f)
+        # Mismo criterio que update_cell (USER_ENTERED), pero todas las celdas en una sola llamada
+        ws.batch_update([{"range": f"{letra_columna(col)}{f}", "values": [[v]]} for f, cols, _ in cambios for col, v in cols.items()], raw=False)
+        if "Ventas" in self.espejos:
+            for f, cols, _ in cambios: self.espejos["Ventas"].fijar(f, cols)
+
+    def fijar_tasa(self, valor):
+        ws = self.hoja("Configuracion")
+        cell = ws.find("TASA_DIA")
+        if cell: ws.update_cell(cell.row, cell.col + 1, valor)
+        else: ws.append_row(["TASA_DIA", valor])
+
+    def recortar(self, hoja, n, conservar=()):
+        # Un deleteDimension por tramo contiguo, de abajo hacia arriba, todo en una llamada.
+        # El espejo (si hay) nota que la hoja cambió por encima de su cola y se recarga completo
+        ws, tramos, i = self.hoja(hoja), [], 0
+        while i < n:
+            if i in conservar: i += 1; continue
+            j = i
+            while j < n and j not in conservar: j += 1
+            tramos.append((i + 1, j + 1))  # índices 0-based de la grilla: la fila de títulos es la 0
+            i = j
+        if tramos:
+            self.libro.batch_update({"requests": [{"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": a, "endIndex": b}}}
+                                                  for a, b in reversed(tramos)]})
+
+
+# =====================================================================
+# SQLITE LOCAL
+# =====================================================================
+def _q(nombre): return '"' + str(nombre).replace('"', '""') + '"'
+
+
+class AlmacenSQLite(Almacen):
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            for hoja, cols in ENCABEZADOS.items(): self._crear_tabla(con, hoja, cols)
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def _crear_tabla(self, con, hoja, cols):
+        # Columnas sin tipo: SQLite guarda cada valor tal cual (texto o número), igual que la hoja
+        con.execute(f"CREATE TABLE IF NOT EXISTS {_q(hoja)} ({', '.join(_q(c) for c in cols)})")
+
+    def _columnas(self, con, hoja):
+        return [r[1] for r in con.execute(f"PRAGMA table_info({_q(hoja)})")]
+
+    def leer(self, hoja):
+        with self._conectar() as con:
+            cur = con.execute(f"SELECT * FROM {_q(hoja)} ORDER BY rowid")
+            cols = [d[0] for d in cur.description]
+            return [{c: ("" if v is None else v) for c, v in zip(cols, fila)} for fila in cur]
+
+    def agregar(self, hoja, filas):
+        if not filas: return
+        with self._conectar() as con:
+            n = len(self._columnas(con, hoja))
+            filas = [(list(f) + [""] * n)[:n] for f in filas]
+            con.executemany(f"INSERT INTO {_q(hoja)} VALUES ({', '.join('?' * n)})", filas)
+
+    def preparar(self):
+        with self._conectar() as con:
+            cols = self._columnas(con, "Ventas")
+            if len(cols) < COL_ID_VENTAS: con.execute(f"ALTER TABLE {_q('Ventas')} ADD COLUMN {_q('ID_Venta')}")
+
+    def actualizar_ventas(self, cambios):
+        with self._conectar() as con:
+            for fila, _, esperado in cambios:
+                if esperado is None: continue
+                valores = con.execute(f"SELECT * FROM {_q('Ventas')} WHERE rowid = ?", (fila - 1,)).fetchone()
+                if valores is None or not _misma_venta(["" if v is None else v for v in valores], esperado): raise FilaMovida(fila)
+            nombres = self._columnas(con, "Ventas")
+            for fila, cols, _ in cambios:
+                for col, valor in cols.items():
+                    con.execute(f"UPDATE {_q('Ventas')} SET {_q(nombres[col - 1])} = ? WHERE rowid = ?", (valor, fila - 1))
+
+    def fijar_tasa(self, valor):
+        with self._conectar() as con:
+            cur = con.execute(f"UPDATE {_q('Configuracion')} SET {_q('Valor')} = ? WHERE {_q('Parametro')} = 'TASA_DIA'", (valor,))
+            if cur.rowcount == 0: con.execute(f"INSERT INTO {_q('Configuracion')} VALUES (?, ?)", ("TASA_DIA", valor))
+
+    def recortar(self, hoja, n, conservar=()):
+        # Se reescribe la tabla para que rowid siga siendo fila - 1
+        if n > 0:
+            registros = self.leer(hoja)
+            self.importar(hoja, [r for i, r in enumerate(registros[:n]) if i in conservar] + registros[n:])
+
+    def importar(self, hoja, registros):
+        # Reemplaza la tabla completa con los registros dados, respetando sus encabezados
+        cols = list(registros[0].keys()) if registros else ENCABEZADOS[hoja]
+        with self._conectar() as con:
+            con.execute(f"DROP TABLE IF EXISTS {_q(hoja)}")
+            self._crear_tabla(con, hoja, cols)
+            con.executemany(f"INSERT INTO {_q(hoja)} VALUES ({', '.join('?' * len(cols))})",
+                            [[r.get(c, "") for c in cols] for r in registros])
+
+
+# =====================================================================
+# CACHE POR HOJA
+# =====================================================================
+def _a_registros(cols, filas):
+    return [dict(zip(cols, (list(f) + [""] * len(cols))[:len(cols)])) for f in filas]
+
+
+class CacheHojas:
+    # Copia en memoria de cada hoja con su propio vencimiento y número de versión. Una escritura
+    # solo toca la hoja escrita: las filas nuevas se agregan localmente sin volver a leerla.
+    # Con una bitácora de cobros, las ventas que aún no suben se siguen viendo tras cada lectura de Ventas.
+    def __init__(self, almacen, ttl=None, bitacora=None):
+        self.almacen = almacen
+        self.bitacora = bitacora
+        self.ttl = dict(TTL_HOJAS, **(ttl or {}))
+        self._datos = {}  # hoja -> [registros, versión, momento de la lectura]
+        self._leida = {}  # hoja -> momento de la última lectura que salió bien
+        self.fallas = {}  # hoja -> último error de lectura, mientras se sirva la copia vieja
+        self._locks = {h: threading.Lock() for h in HOJAS}  # cortos: solo para leer o cambiar la copia en memoria
+        self._refrescando = threading.Lock()  # una sola lectura al almacén a la vez; nunca con un candado de hoja tomado
+        self._indice = {}  # ID_Venta -> posición en Ventas (fila de la hoja = posición + 2)
+        self._indexadas = (0, None)  # (ventas indexadas, clave de la última)
+
+    def leer(self, hoja, refrescar=True):
+        # refrescar=False: la copia en memoria aunque esté vencida (solo se lee la hoja si nunca se leyó)
+        with self._locks[hoja]: vencida = self._vencida(hoja, refrescar)
+        if vencida: self._refrescar([hoja], refrescar)
+        with self._locks[hoja]:
+            e = self._datos[hoja]
+            return e[0], e[1]
+
+    def instantanea(self, refrescar=True):
+        # Las hojas vencidas se piden juntas: una sola ida al almacén (un batchGet en Sheets) en vez de una por hoja.
+        # La lectura va sin candados de hoja; después se toman todos un instante para copiar una versión coherente
+        with self._candados(HOJAS): vencidas = [h for h in HOJAS if self._vencida(h, refrescar)]
+        if vencidas: self._refrescar(vencidas, refrescar)
+        with self._candados(HOJAS): lecturas = [self._datos[h] for h in HOJAS]
+        return tuple(e[0] for e in lecturas), tuple(e[1] for e in lecturas)
+
+    def _candados(self, hojas):
+        candados = ExitStack()
+        for h in hojas: candados.enter_context(self._locks[h])
+        return candados
+
+    def _vencida(self, hoja, refrescar):
+        e = self._datos.get(hoja)
+        return e is None or (refrescar and time.time() - e[2] > self.ttl[hoja])
+
+    def _refrescar(self, hojas, refrescar=True):
+        # Sin candados de hoja tomados: mientras se espera al almacén, los cobros y ediciones locales siguen
+        with self._refrescando:
+            # Otra sesión pudo haberlas leído mientras se esperaba el turno
+            with self._candados(hojas):
+                hojas = [h for h in hojas if self._vencida(h, refrescar)]
+                antes = {h: self._datos[h][1] for h in hojas if h in self._datos}
+            if not hojas: return
+            try: leidas = self.almacen.leer_varias(hojas)
+            except Exception as error:
+                with self._candados(hojas):
+                    if any(h not in self._datos for h in hojas): raise  # sin copia previa no hay nada que mostrar
+                    # Sin conexión o sin cuota: se sigue con la última copia buena en vez de detener la app
+                    for h in hojas:
+                        self.fallas[h] = error
+                        self._datos[h][2] = time.time() - self.ttl[h] + REINTENTO_LECTURA
+                return
+            for hoja in hojas:
+                registros = leidas[hoja]
+                if hoja == "Ventas" and self.bitacora is not None:
+                    faltan = self.bitacora.faltantes(registros)
+                    if faltan: registros = registros + _a_registros(list(registros[0].keys()) if registros else ENCABEZADOS["Ventas"], faltan)
+                with self._locks[hoja]:
+                    e = self._datos.get(hoja)
+                    self.fallas.pop(hoja, None); self._leida[hoja] = time.time()
+                    if e is not None and e[1] != antes.get(hoja):
+                        # Se escribió en memoria durante la lectura y no se sabe si la hoja ya lo tenía: se conserva
+                        # la copia local y la próxima consulta vuelve a leer
+                        e[2] = 0
+                        continue
+                    if e is None or (registros is not e[0] and registros != e[0]): e = [registros, next(_VERSIONES), 0]
+                    e[2] = time.time()
+                    self._datos[hoja] = e
+
+    def atrasadas(self):
+        # {hoja: segundos desde su última lectura buena} de las hojas que se están sirviendo viejas
+        return {h: time.time() - self._leida.get(h, time.time()) for h in list(self.fallas)}
+
+    def invalidar(self, *hojas):
+        for h in hojas or HOJAS:
+            with self._locks[h]:
+                if h in self._datos: self._datos[h][2] = 0  # vence ya; se conserva para comparar
+
+    def agregar_local(self, hoja, filas):
+        with self._locks[hoja]:
+            e = self._datos.get(hoja)
+            if not e or not e[0]:
+                if e: e[2] = 0
+                return
+            self._datos[hoja] = [e[0] + _a_registros(list(e[0][0].keys()), filas), next(_VERSIONES), e[2]]
+
+    def cambiar_local(self, hoja, cambios):
+        # Refleja en memoria cambios ya escritos en la hoja ({posición: {campo: valor}}), sin volver a leerla
+        with self._locks[hoja]:
+            e = self._datos.get(hoja)
+            if not e: return
+            registros = list(e[0])
+            for pos, campos in cambios.items():
+                if pos < len(registros): registros[pos] = dict(registros[pos], **campos)
+            self._datos[hoja] = [registros, next(_VERSIONES), e[2]]
+
+    def ubicar_venta(self, id_buscado):
+        # (fila de la hoja, registro en memoria) de una venta por su ID; KeyError si no está en memoria
+        registros, _ = self.leer("Ventas")
+        with self._locks["Ventas"]:
+            n, clave = self._indexadas
+            if n > len(registros) or (n and _clave_venta(registros[n - 1]) != clave): self._indice, n = {}, 0
+            for i in range(n, len(registros)):
+                if registros[i].get("ID_Venta"): self._indice[str(registros[i]["ID_Venta"]).strip()] = i
+            if registros: self._indexadas = (len(registros), _clave_venta(registros[-1]))
+        if id_buscado in self._indice: pos = self._indice[id_buscado]
+        elif id_buscado[:1] == "F" and id_buscado[1:].isdigit(): pos = int(id_buscado[1:]) - 2
+        else: raise KeyError(id_buscado)
+        if not 0 <= pos < len(registros) or id_venta(registros[pos], pos) != id_buscado: raise KeyError(id_buscado)
+        return pos + 2, registros[pos]
+
+
+def copiar(origen, destino):
+    for hoja in HOJAS: destino.importar(hoja, origen.leer(hoja))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or sys.argv[1] != "copiar":
+        sys.exit("Uso: python almacen.py copiar <ruta.db>")
+    import tomllib
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".streamlit", "secrets.toml"), "rb") as f:
+        secretos = tomllib.load(f)
+    copiar(AlmacenSheets(dict(secretos["gcp_service_account"]), incremental=False), AlmacenSQLite(sys.argv[2]))
+    print(f"✅ Libro copiado a {sys.argv[2]}")
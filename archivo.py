@@ -0,0 +1,213 @@
+"""Archivo histórico: los meses cerrados de Ventas, Cargas e Inventario en Parquet local.
+
+`python archivo.py archivar` saca del libro vivo las filas de meses ya cerrados
+(el bloque inicial anterior al mes en curso; los pedidos pendientes se quedan
+en el libro hasta que se entreguen). Las guarda como
+archivo/<Hoja>/<AAAA-MM>.parquet y las borra del libro. Del archivo se guarda también un resumen diario con los mismos totales
+de ResumenDiario. BALANCE, CAJA GENERAL y MAPA DE CALOR arrancan de ese resumen
+y solo pliegan las filas vivas, así la historia no se vuelve a pagar en cada
+refresco.
+
+Uso por consola (mejor con la caja cerrada: el libro se reescribe):
+    python archivo.py archivar [AAAA-MM]    # por defecto, todo lo anterior al mes en curso
+    python archivo.py reconstruir           # rehace el resumen desde los Parquet
+"""
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter, defaultdict
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+HOJAS_ARCHIVO = ("Ventas", "Cargas", "Inventario")
+_MES = re.compile(r"^\d{4}-\d{2}$")
+FORMATO_RESUMEN = 2  # se sube cuando cambian las claves de ResumenDiario: un resumen de otro formato se rehace
+
+
+def _marca(firma):
+    # Lo que se guarda en resumen/firma.json, tal como vuelve de json.load
+    return {"formato": FORMATO_RESUMEN, "firma": [list(f) for f in firma]}
+
+
+def _mes(registro):
+    return str(registro.get("Fecha", "")).strip()[:7]
+
+
+class Historico:
+    # Lo que la app usa del archivo: el resumen por día y las filas de Cargas e Inventario (son pocas)
+    def __init__(self, firma=(), dias=None, productos=None, horas=None, cargas=(), inventario=()):
+        self.firma = firma
+        self.dias = dias or {}  # fecha -> Counter de totales (mismas claves que ResumenDiario.dias)
+        self.productos = productos or {}  # fecha -> Counter de unidades por producto
+        self.horas = horas or {}  # fecha -> arreglo 2 × 24 [ventas, monto en Bs]
+        self.cargas, self.inventario = list(cargas), list(inventario)
+
+    @property
+    def vacio(self): return not (self.dias or self.cargas or self.inventario)
+
+    @property
+    def tanque(self):
+        # Litros con los que arranca el libro vivo: todo lo cargado menos todo lo despachado en el archivo
+        return sum(d.get("litros_cargados", 0.0) - d.get("litros_vendidos", 0.0) for d in self.dias.values())
+
+    def unidades(self):
+        total = Counter()
+        for c in self.productos.values(): total.update(c)
+        return total
+
+
+class Archivo:
+    def __init__(self, carpeta):
+        self.carpeta = carpeta
+        self._historico = None
+        self._lock = threading.Lock()
+
+    def _ruta(self, *partes): return os.path.join(self.carpeta, *partes)
+
+    # --- MESES ---
+    def meses(self, hoja):
+        try: return sorted(n[:-8] for n in os.listdir(self._ruta(hoja)) if n.endswith(".parquet") and _MES.match(n[:-8]))
+        except FileNotFoundError: return []
+
+    def firma(self):
+        return tuple((h, m, os.stat(self._ruta(h, f"{m}.parquet")).st_mtime_ns) for h in HOJAS_ARCHIVO for m in self.meses(h))
+
+    def leer(self, hoja, desde=None, hasta=None):
+        # Registros archivados de la hoja entre los meses `desde` y `hasta` (AAAA-MM, inclusive), en orden
+        registros = []
+        for m in self.meses(hoja):
+            if (desde and m < desde) or (hasta and m > hasta): continue
+            registros += pd.read_parquet(self._ruta(hoja, f"{m}.parquet")).to_dict("records")
+        return registros
+
+    def tramos(self, hoja, desde=None, hasta=None, tamano=20000):
+        # Igual que leer(), pero de a `tamano` registros por vez sin cargar cada mes completo
+        import pyarrow.parquet as pq
+        for m in self.meses(hoja):
+            if (desde and m < desde) or (hasta and m > hasta): continue
+            for lote in pq.ParquetFile(self._ruta(hoja, f"{m}.parquet")).iter_batches(batch_size=tamano): yield lote.to_pylist()
+
+    def guardar_mes(self, hoja, mes, registros):
+        # Todo como texto, igual que en la hoja (las columnas mezclan números y "N/A"); se suma a lo que ya hubiera.
+        # Las filas que el mes ya tiene no se repiten: volver a archivar tras un corte a medias (Parquet escrito,
+        # libro sin recortar) no duplica nada. Se cuentan como multiconjunto por si hay filas idénticas legítimas
+        os.makedirs(self._ruta(hoja), exist_ok=True)
+        ruta = self._ruta(hoja, f"{mes}.parquet")
+        nuevo = pd.DataFrame(registros).astype(str)
+        if os.path.exists(ruta):
+            previo = pd.read_parquet(ruta)
+            ya = Counter(previo.reindex(columns=nuevo.columns).astype(str).itertuples(index=False, name=None))
+            quedan = []
+            for fila in nuevo.itertuples(index=False, name=None):
+                if ya[fila] > 0: ya[fila] -= 1
+                else: quedan.append(fila)
+            if not quedan: return
+            nuevo = pd.concat([previo, pd.DataFrame(quedan, columns=nuevo.columns)], ignore_index=True)
+        nuevo.to_parquet(ruta + ".tmp", index=False)
+        os.replace(ruta + ".tmp", ruta)
+
+    # --- RESUMEN ---
+    def reconstruir(self, productos, tasa):
+        # Pliega todo el archivo con ResumenDiario y guarda sus totales por día
+        from resumenes import ResumenDiario
+        firma = self.firma()
+        cargas, inventario = self.leer("Cargas"), self.leer("Inventario")
+        r = ResumenDiario().actualizar((0,), self.leer("Ventas"), cargas, inventario, productos, tasa)
+        carpeta = self._ruta("resumen")
+        os.makedirs(carpeta, exist_ok=True)
+        dias = pd.DataFrame.from_dict(r.dias, orient="index").fillna(0.0)
+        dias.index = dias.index.map(date.isoformat); dias.index.name = "Fecha"
+        dias.to_parquet(os.path.join(carpeta, "dias.parquet"))
+        pd.DataFrame([(d.isoformat(), p, q) for d, c in r.productos.items() for p, q in c.items() if q],
+                     columns=["Fecha", "Producto", "Cantidad"]).to_parquet(os.path.join(carpeta, "productos.parquet"), index=False)
+        horas = pd.DataFrame([[d.isoformat(), i, *arr[i]] for d, arr in r.horas.items() for i in range(2)],
+                             columns=["Fecha", "Medida"] + [f"h{h}" for h in range(24)])
+        horas.to_parquet(os.path.join(carpeta, "horas.parquet"), index=False)
+        with open(os.path.join(carpeta, "firma.json"), "w", encoding="utf-8") as f: json.dump(_marca(firma), f)
+        return firma
+
+    def historico(self, productos, tasa):
+        # Se carga una vez por firma del archivo; si el resumen quedó viejo (archivado a mano, corte a medias) se rehace
+        firma = self.firma()
+        with self._lock:
+            if self._historico is not None and self._historico.firma == firma: return self._historico
+            if not firma:
+                self._historico = Historico()
+                return self._historico
+            carpeta = self._ruta("resumen")
+            try:
+                with open(os.path.join(carpeta, "firma.json"), encoding="utf-8") as f: vigente = json.load(f) == _marca(firma)
+            except (OSError, ValueError): vigente = False
+            if not vigente: self.reconstruir(productos, tasa)
+
+            dias_df = pd.read_parquet(os.path.join(carpeta, "dias.parquet"))
+            dias = {date.fromisoformat(d): Counter({k: v for k, v in fila.items() if v}) for d, fila in dias_df.to_dict("index").items()}
+            productos_dia = defaultdict(Counter)
+            for d, p, q in pd.read_parquet(os.path.join(carpeta, "productos.parquet")).itertuples(index=False):
+                productos_dia[date.fromisoformat(d)][p] += int(q)
+            horas = defaultdict(lambda: np.zeros((2, 24)))
+            for fila in pd.read_parquet(os.path.join(carpeta, "horas.parquet")).itertuples(index=False):
+                horas[date.fromisoformat(fila[0])][int(fila[1])] = fila[2:]
+            self._historico = Historico(firma, dias, dict(productos_dia), dict(horas), self.leer("Cargas"), self.leer("Inventario"))
+            return self._historico
+
+
+def _a_archivar(hoja, registros, antes_de):
+    # (n, pendientes): las primeras n filas son de meses anteriores a `antes_de`; de ellas, las posiciones
+    # de pedidos pendientes no se archivan (siguen vivos en POR ENTREGAR)
+    col_estado = list(registros[0].keys())[10] if hoja == "Ventas" and registros and len(registros[0]) >= 11 else None
+    n, pendientes = 0, set()
+    for r in registros:
+        mes = _mes(r)
+        if not _MES.match(mes) or mes >= antes_de: break
+        if col_estado and str(r.get(col_estado, "")).strip().upper() == "PENDIENTE": pendientes.add(n)
+        n += 1
+    return n, pendientes
+
+
+def archivar(almacen, archivo, antes_de=None):
+    """Mueve al archivo las filas de los meses anteriores a `antes_de` (AAAA-MM; por defecto el mes en curso)."""
+    from modelo import procesar_maestros
+    antes_de = antes_de or datetime.now().strftime("%Y-%m")
+    movidas = {}
+    for hoja in HOJAS_ARCHIVO:
+        registros = almacen.leer(hoja)
+        n, pendientes = _a_archivar(hoja, registros, antes_de)
+        if n == len(pendientes): continue
+        por_mes = defaultdict(list)
+        for i, r in enumerate(registros[:n]):
+            if i not in pendientes: por_mes[_mes(r)].append(r)
+        for mes, filas in por_mes.items(): archivo.guardar_mes(hoja, mes, filas)
+        almacen.recortar(hoja, n, pendientes)  # primero el Parquet, después el borrado: un corte a medias no pierde filas
+        movidas[hoja] = n - len(pendientes)
+    archivo.reconstruir(*procesar_maestros(almacen.leer("Productos"), almacen.leer("Configuracion")))
+    return movidas
+
+
+def conectar():
+    """(almacen, archivo) según .streamlit/secrets.toml, para los comandos de consola."""
+    import tomllib
+    from almacen import AlmacenSheets, AlmacenSQLite
+    base = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(base, ".streamlit", "secrets.toml"), "rb") as f: secretos = tomllib.load(f)
+    app = secretos.get("app", {})
+    if app.get("almacen", "sheets") == "sqlite": almacen = AlmacenSQLite(app.get("ruta_sqlite", os.path.join(base, "agua_control.db")))
+    else: almacen = AlmacenSheets(dict(secretos["gcp_service_account"]), incremental=False)
+    return almacen, Archivo(app.get("carpeta_archivo", os.path.join(base, "archivo")))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("archivar", "reconstruir"):
+        sys.exit("Uso: python archivo.py archivar [AAAA-MM] | reconstruir")
+    almacen, archivo = conectar()
+    if sys.argv[1] == "reconstruir":
+        from modelo import procesar_maestros
+        archivo.reconstruir(*procesar_maestros(almacen.leer("Productos"), almacen.leer("Configuracion")))
+        print("✅ Resumen del archivo reconstruido")
+    else:
+        movidas = archivar(almacen, archivo, sys.argv[2] if len(sys.argv) > 2 else None)
+        print("✅ " + (", ".join(f"{h}: {n} filas" for h, n in movidas.items()) or "No había meses cerrados por archivar"))
@@ -0,0 +1,128 @@
+"""Mide las funciones puras de la app sobre un libro sintético (benchmarks/generador.py).
+
+Cada caso se repite varias veces y se guarda la mediana en milisegundos en
+benchmarks/resultados.jsonl junto con el commit, así una regresión se ve al
+comparar contra la corrida anterior del mismo tamaño.
+
+Uso (desde la raíz del repo):
+    python -m benchmarks.correr                  # 50 mil ventas
+    python -m benchmarks.correr 500000 --repetir 3
+    python -m benchmarks.correr 50000 --solo resumen
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import date, datetime
+
+from benchmarks.generador import generar
+from costos import tabla_costos
+from detalles import tabla_items, unidades_por_sku
+from modelo import Modelo, calcular_stock, procesar_maestros
+from resumenes import ResumenDiario
+from tanque import LibroTanque
+
+RESULTADOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resultados.jsonl")
+
+
+def _commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError): return "?"
+
+
+def casos(libro):
+    """Casos a medir: nombre -> (preparar, medir). `preparar` arma el estado fresco de cada repetición, fuera del cronómetro."""
+    prod, conf, cargas, ventas, inv = libro
+    productos, tasa = procesar_maestros(prod, conf)
+    fechas = sorted({r["Fecha"] for r in ventas})
+    primero, ultimo = date.fromisoformat(fechas[0]), date.fromisoformat(fechas[-1])
+    mes = ultimo.replace(day=1)
+    lleno = ResumenDiario().actualizar((1,), ventas, cargas, inv, productos, tasa)
+    libro_tanque = LibroTanque().actualizar((1,), cargas, ventas)
+    corte = max(len(ventas) - 20, 0)  # las últimas 20 ventas llegan "nuevas" al resumen incremental
+    items = tabla_items(Modelo((1,), libro).df_v_bruto, productos)
+    modelo = Modelo((1,), libro)
+    modelo.df_v_bruto, modelo.df_i, modelo.ventas_por_sku  # tipados fuera del cronómetro
+    momento = datetime.combine(primero + (ultimo - primero) / 2, datetime.min.time())
+
+    return {
+        "procesar_maestros": (None, lambda _: procesar_maestros(prod, conf)),
+        "calcular_stock": (None, lambda _: calcular_stock(cargas, modelo.df_v_bruto)),
+        "tipar_ventas": (lambda: Modelo((1,), libro), lambda m: m.df_v),
+        "tabla_items": (lambda: Modelo((1,), libro).df_v_bruto, lambda df: tabla_items(df, productos)),
+        "ventas_por_sku": (None, lambda _: unidades_por_sku(items, productos)),
+        "pendientes": (lambda: Modelo((1,), libro), lambda m: m.pendientes),
+        "tabla_costos": (None, lambda _: tabla_costos(modelo.df_i, modelo.ventas_por_sku)),
+        "resumen_completo": (ResumenDiario, lambda r: r.actualizar((1,), ventas, cargas, inv, productos, tasa)),
+        "resumen_incremental": (lambda: ResumenDiario().actualizar((1,), ventas[:corte], cargas, inv, productos, tasa),
+                                lambda r: r.actualizar((2,), ventas, cargas, inv, productos, tasa)),
+        "resumen_tabla": (lambda: setattr(lleno, "_tabla", None), lambda _: lleno.tabla()),
+        "diario_dia": (None, lambda _: lleno.dia(ultimo)),
+        "balance_mes": (None, lambda _: (lleno.rango(mes, ultimo), lleno.unidades(mes, ultimo))),
+        "caja_total": (None, lambda _: lleno.total()),
+        "mapa_calor": (None, lambda _: lleno.mapa(mes, ultimo)),
+        "tanque_completo": (LibroTanque, lambda t: t.actualizar((1,), cargas, ventas)),
+        "tanque_incremental": (lambda: LibroTanque().actualizar((1,), cargas, ventas[:corte]),
+                               lambda t: t.actualizar((2,), cargas, ventas)),
+        "tanque_nivel_en": (None, lambda _: libro_tanque.nivel_en(momento)),
+    }
+
+
+def medir(preparar, funcion, repetir):
+    tiempos = []
+    for _ in range(repetir):
+        estado = preparar() if preparar else None
+        gc.collect()
+        t0 = time.perf_counter()
+        funcion(estado)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(tiempos)
+
+
+def anterior(filas, commit):
+    # Última corrida guardada del mismo tamaño en otro commit
+    if not os.path.exists(RESULTADOS): return None
+    previa = None
+    with open(RESULTADOS, encoding="utf-8") as f:
+        for linea in f:
+            r = json.loads(linea)
+            if r["filas"] == filas and r["commit"] != commit: previa = r
+    return previa
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmarks de Agua Control sobre un libro sintético")
+    p.add_argument("filas", nargs="?", type=int, default=50000, help="ventas a generar (50000 por defecto)")
+    p.add_argument("--repetir", type=int, default=5)
+    p.add_argument("--semilla", type=int, default=7)
+    p.add_argument("--solo", default="", help="mide solo los casos cuyo nombre contenga este texto")
+    p.add_argument("--no-guardar", action="store_true", help="no agrega la corrida a resultados.jsonl")
+    args = p.parse_args()
+
+    t0 = time.perf_counter()
+    libro = generar(args.filas, semilla=args.semilla)
+    print(f"Libro sintético: {len(libro[3])} ventas, {len(libro[2])} cargas, {len(libro[4])} compras ({time.perf_counter() - t0:.1f} s)")
+
+    commit = _commit()
+    previa = anterior(args.filas, commit)
+    tiempos = {}
+    for nombre, (preparar, funcion) in casos(libro).items():
+        if args.solo not in nombre: continue
+        tiempos[nombre] = round(medir(preparar, funcion, args.repetir), 3)
+        linea = f"{nombre:<22}{tiempos[nombre]:>11.2f} ms"
+        if previa and nombre in previa["tiempos"] and previa["tiempos"][nombre] > 0:
+            linea += f"   {tiempos[nombre] / previa['tiempos'][nombre]:>5.2f}x vs {previa['commit']}"
+        print(linea)
+
+    if not args.no_guardar:
+        with open(RESULTADOS, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"commit": commit, "fecha": datetime.now().isoformat(timespec="seconds"), "filas": args.filas,
+                                "repetir": args.repetir, "python": platform.python_version(), "tiempos": tiempos}, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
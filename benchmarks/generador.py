@@ -0,0 +1,106 @@
+"""Libro de ventas sintético para medir la app a escala (50 mil, 500 mil filas...).
+
+Genera las cinco hojas con los mismos encabezados que almacen.ENCABEZADOS y con
+la mezcla que se ve en la planta: pagos en Bs, móvil, punto y divisa con su
+vuelto, pagos mixtos, pedidos pendientes con cliente, anulaciones, tickets de
+varios productos, cisternas, gastos, depósitos, calibraciones y compras de
+envases. Con la misma semilla sale siempre el mismo libro.
+
+Uso por consola (volcar el libro a un SQLite para abrirlo con la app):
+    python -m benchmarks.generador 50000 /tmp/agua_50k.db
+"""
+import random
+import sys
+from datetime import date, timedelta
+
+from almacen import ENCABEZADOS, HOJAS
+
+# (Producto, SKU, precio Bs, litros, categoría, controla stock)
+PRODUCTOS = (
+    ("Recarga Botellón 20L", "R20", 40, 20, "💧 Recargas", "NO"),
+    ("Recarga Botellón 12L", "R12", 25, 12, "💧 Recargas", "NO"),
+    ("Recarga Botellón 5L", "R05", 12, 5, "💧 Recargas", "NO"),
+    ("Botellón Nuevo", "BN", 300, 20, "🧴 Envases", "SI"),
+    ("Botellón Nuevo 12L", "BN12", 220, 12, "🧴 Envases", "SI"),
+    ("Tapas", "TP", 10, 0, "🧴 Envases", "SI"),
+    ("Asa para Botellón", "ASA", 35, 0, "🧴 Envases", "SI"),
+    ("Botella 1.5L", "B15", 15, 1.5, "🥤 Botellas", "SI"),
+    ("Fardo Botellas 600ml", "F06", 90, 7.2, "🥤 Botellas", "SI"),
+    ("Hielo 3Kg", "H3", 30, 3, "🧊 Hielo", "NO"),
+)
+# Peso de cada producto en los tickets (las recargas de 20 L son casi todo)
+PESOS = (60, 15, 6, 3, 1, 4, 2, 4, 2, 3)
+METODOS = (("Efectivo", 30), ("Pago Móvil", 35), ("Punto de Venta", 15), ("Divisa", 12), ("Mixto", 5), ("Pendiente", 3))
+VENDEDORES = ("Admin", "Pedro", "María", "José")
+CLIENTES = ("Ana", "Luis", "Bodega El Sol", "Carmen", "Panadería La Fe", "Colegio San José", "Rosa", "Miguel")
+
+
+def _tasa(dia):
+    # Tasa que sube poco a poco, como la del BCV
+    return round(36.0 * 1.0015 ** dia, 2)
+
+
+def generar(n_ventas, semilla=7, inicio=date(2024, 1, 1), por_dia=180):
+    """Devuelve (productos, configuracion, cargas, ventas, inventario) como listas de dicts, igual que Almacen.leer() de cada hoja."""
+    rnd = random.Random(semilla)
+    prods = [dict(zip(ENCABEZADOS["Productos"], (n, sku, pr, l, cat, f"{sku}.png", ctrl))) for n, sku, pr, l, cat, ctrl in PRODUCTOS]
+    dias = max(1, -(-n_ventas // por_dia))
+    conf = [{"Parametro": "TASA_DIA", "Valor": _tasa(dias)}]
+    ventas, cargas, inventario = [], [], []
+
+    def venta(fecha, hora, *valores):
+        ventas.append(dict(zip(ENCABEZADOS["Ventas"], (fecha, hora) + valores)))
+
+    for d in range(dias):
+        fecha, tasa = (inicio + timedelta(days=d)).isoformat(), _tasa(d)
+        if d % 3 == 0:
+            cargas.append(dict(zip(ENCABEZADOS["Cargas"], (fecha, "07:30:00", 15000, round(4500 * tasa / 36), "Chofer", tasa))))
+        if d % 7 == 6:
+            cargas.append(dict(zip(ENCABEZADOS["Cargas"], (fecha, "18:00:00", 0, round(60 * tasa, 2), "GASTO/NÓMINA: Nómina semanal", tasa))))
+            cargas.append(dict(zip(ENCABEZADOS["Cargas"], (fecha, "18:30:00", 0, round(400 * tasa, 2), f"DEPÓSITO: Depósito en Cuenta (Ref: {d})", tasa))))
+            inventario.append(dict(zip(ENCABEZADOS["Inventario"], (fecha, "09:00:00", "BN", 20, round(20 * 6.5 * tasa, 2), tasa))))
+            inventario.append(dict(zip(ENCABEZADOS["Inventario"], (fecha, "09:00:00", "TP", 200, round(200 * 0.08 * tasa, 2), tasa))))
+            inventario.append(dict(zip(ENCABEZADOS["Inventario"], (fecha, "09:00:00", "B15", 120, round(120 * 0.25 * tasa, 2), tasa))))
+        if d % 15 == 14:
+            cargas.append(dict(zip(ENCABEZADOS["Cargas"], (fecha, "20:00:00", -round(rnd.uniform(10, 80)), 0, "MERMA/CALIBRACIÓN: Faltante de agua", tasa))))
+
+        inicio_dia = len(ventas)
+        while len(ventas) - inicio_dia < por_dia and len(ventas) < n_ventas:
+            hora = f"{rnd.randint(8, 20):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}"
+            elegidos = rnd.choices(PRODUCTOS, PESOS, k=rnd.choice((1, 1, 1, 2, 2, 3)))
+            items = {}
+            for p in elegidos: items[p] = items.get(p, 0) + rnd.randint(1, 3)
+            texto = ", ".join(f"{q}x {p[0]}" for p, q in items.items())
+            total = sum(q * p[2] * tasa / 36 for p, q in items.items())
+            litros = sum(q * p[3] for p, q in items.items())
+            metodo = rnd.choices([m for m, _ in METODOS], [w for _, w in METODOS])[0]
+            vendedor = rnd.choice(VENDEDORES)
+            estado = "ANULADA: Error de cobro" if rnd.random() < 0.02 else "Activa"
+            id_t = f"{fecha[2:4]}{fecha[5:7]}{fecha[8:10]}{hora.replace(':', '')}-{rnd.randrange(16 ** 4):04x}"
+
+            if metodo == "Divisa":
+                usd = -(-total // tasa) + 0.0  # redondeado al dólar entero de arriba
+                venta(fecha, hora, vendedor, texto, usd, "USD", tasa, "Divisa", "N/A", litros, estado, f"{id_t}-1")
+                vuelto = round(usd * tasa - total, 2)
+                if vuelto > 0: venta(fecha, hora, vendedor, f"Vuelto ({texto})", -vuelto, "VES", tasa, "Efectivo", "Salida Caja", 0, estado, f"{id_t}-2")
+            elif metodo == "Mixto":
+                venta(fecha, hora, vendedor, texto, round(total / 2, 2), "VES", tasa, "Efectivo", "N/A", litros, estado, f"{id_t}-1")
+                venta(fecha, hora, vendedor, "Complemento Mixto", round(total / 2, 2), "VES", tasa, "Pago Móvil", str(rnd.randint(1000, 9999)), 0, estado, f"{id_t}-2")
+            elif metodo == "Pendiente":
+                adelantado = rnd.random() < 0.5
+                venta(fecha, hora, vendedor, f"{texto} (Cliente: {rnd.choice(CLIENTES)})", 0 if adelantado else round(total, 2), "VES", tasa,
+                      "Adelantado" if adelantado else "Pago Móvil", "N/A", litros, "Pendiente" if rnd.random() < 0.3 else "Entregada", f"{id_t}-1")
+            else:
+                ref = "N/A" if metodo == "Efectivo" else str(rnd.randint(1000, 9999))
+                venta(fecha, hora, vendedor, texto, round(total, 2), "VES", tasa, metodo, ref, litros, estado, f"{id_t}-1")
+
+        ventas[inicio_dia:] = sorted(ventas[inicio_dia:], key=lambda r: r["Hora"])
+    return prods, conf, cargas, ventas[:n_ventas], inventario
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3: sys.exit("Uso: python -m benchmarks.generador <filas_de_ventas> <ruta.db>")
+    from almacen import AlmacenSQLite
+    libro, destino = generar(int(sys.argv[1])), AlmacenSQLite(sys.argv[2])
+    for hoja, registros in zip(HOJAS, libro): destino.importar(hoja, registros)
+    print(f"✅ {len(libro[3])} ventas generadas en {sys.argv[2]}")
@@ -0,0 +1,126 @@
+"""Bitácora local de cobros: la venta se guarda primero en disco y se sube al libro por detrás.
+
+El cobro anota las filas del ticket en un SQLite local (una transacción, sin
+red) y vuelve al instante. Un hilo de fondo las sube a Ventas en el mismo orden
+en que se cobraron; si Sheets no responde o no hay cuota, espera y reintenta sin
+perder nada, aunque la app se reinicie. La clave de cada ticket es su ID_Venta:
+cada intento se anota en disco antes de subir, y antes de repetir uno se mira si
+sus filas ya llegaron a la hoja: ni una respuesta perdida ni una caída de la app
+entre la subida y la confirmación duplican la venta. Anular o entregar una venta
+que sigue en cola edita sus filas aquí, y suben ya editadas.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from almacen import COL_ID_VENTAS
+
+_VACIANDO = defaultdict(threading.Lock)  # ruta de la bitácora -> un solo hilo subiendo a la vez
+
+
+def _id_fila(fila):
+    return str(fila[COL_ID_VENTAS - 1] if len(fila) >= COL_ID_VENTAS else "").strip()
+
+
+class Bitacora:
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.aviso = threading.Event()  # se enciende con cada ticket anotado
+        self.error = None  # último error al subir, mientras queden tickets
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE IF NOT EXISTS ventas (seq INTEGER PRIMARY KEY AUTOINCREMENT, ticket TEXT, filas TEXT, "
+                        "creada REAL, intentos INTEGER DEFAULT 0, error TEXT)")
+
+    def _conectar(self):
+        return sqlite3.connect(self.ruta, timeout=10)
+
+    def anotar(self, ticket, filas):
+        # Queda en disco antes de volver: desde aquí la venta no se pierde aunque se caiga la red o la app
+        with self._conectar() as con:
+            con.execute("INSERT INTO ventas (ticket, filas, creada) VALUES (?, ?, ?)", (ticket, json.dumps(filas, ensure_ascii=False, default=str), time.time()))
+        self.aviso.set()
+
+    def pendientes(self):
+        # [(seq, ticket, filas, intentos)] en el orden en que se cobraron
+        with self._conectar() as con:
+            return [(s, t, json.loads(f), i) for s, t, f, i in con.execute("SELECT seq, ticket, filas, intentos FROM ventas ORDER BY seq")]
+
+    def cuantas(self):
+        with self._conectar() as con: return con.execute("SELECT COUNT(*) FROM ventas").fetchone()[0]
+
+    def confirmar(self, seq):
+        with self._conectar() as con: con.execute("DELETE FROM ventas WHERE seq = ?", (seq,))
+
+    def intentar(self, seq):
+        # Queda anotado antes de subir: si la app se cae con las filas ya en la hoja, el próximo intento las busca
+        with self._conectar() as con: con.execute("UPDATE ventas SET intentos = intentos + 1 WHERE seq = ?", (seq,))
+
+    def fallo(self, seq, error):
+        with self._conectar() as con: con.execute("UPDATE ventas SET error = ? WHERE seq = ?", (str(error), seq))
+
+    def editar(self, cambios):
+        # cambios = {ID_Venta: {columna 1-based: valor}}. Las filas que siguen en cola se editan aquí (anular, entregar),
+        # esperando a que termine una subida en curso; devuelve los IDs editados (los demás ya están en la hoja)
+        editados = set()
+        with _VACIANDO[os.path.abspath(self.ruta)], self._conectar() as con:
+            for seq, texto in con.execute("SELECT seq, filas FROM ventas ORDER BY seq").fetchall():
+                filas = json.loads(texto)
+                tocadas = [f for f in filas if _id_fila(f) in cambios]
+                for f in tocadas:
+                    for col, valor in cambios[_id_fila(f)].items():
+                        f.extend([""] * (col - len(f)))
+                        f[col - 1] = valor
+                    editados.add(_id_fila(f))
+                if tocadas: con.execute("UPDATE ventas SET filas = ? WHERE seq = ?", (json.dumps(filas, ensure_ascii=False, default=str), seq))
+        return editados
+
+    def faltantes(self, registros, cola=2000):
+        # Filas anotadas que todavía no aparecen en los registros leídos de Ventas (se buscan por ID en la cola de la hoja)
+        filas = [f for _, _, fs, _ in self.pendientes() for f in fs]
+        if not filas: return []
+        vistos = {str(r.get("ID_Venta", "")).strip() for r in registros[-cola:]}
+        return [f for f in filas if _id_fila(f) not in vistos]
+
+
+class Sincronizador:
+    # Hilo de fondo que vacía la bitácora en el almacén; tras un error espera cada vez más (hasta pausa_max)
+    def __init__(self, bitacora, almacen, pausa=5, pausa_max=120):
+        self.bitacora, self.almacen = bitacora, almacen
+        self.pausa, self.pausa_max = pausa, pausa_max
+        self._hilo = threading.Thread(target=self._correr, name="sincronizador-ventas", daemon=True)
+        self._hilo.start()
+
+    def _correr(self):
+        espera = self.pausa
+        while True:
+            self.bitacora.aviso.wait(espera if self.bitacora.cuantas() else None)
+            self.bitacora.aviso.clear()
+            try:
+                self.vaciar()
+                espera = self.pausa
+            except Exception as e:
+                self.bitacora.error = e
+                espera = min(self.pausa_max, espera * 2)
+
+    def vaciar(self):
+        # Sube los tickets en orden; al primer error se detiene para no desordenar la hoja
+        with _VACIANDO[os.path.abspath(self.bitacora.ruta)]:
+            subidos = 0
+            for seq, ticket, filas, intentos in self.bitacora.pendientes():
+                # Un intento anterior pudo haber llegado a la hoja aunque la respuesta (o la app) se perdiera
+                if not (intentos and self._ya_subido(filas)):
+                    self.bitacora.intentar(seq)
+                    try: self.almacen.agregar("Ventas", filas)
+                    except Exception as e: self.bitacora.fallo(seq, e); raise
+                self.bitacora.confirmar(seq)
+                subidos += 1
+            self.bitacora.error = None
+            return subidos
+
+    def _ya_subido(self, filas, cola=2000):
+        ids = {_id_fila(f) for f in filas} - {""}
+        return bool(ids) and any(str(r.get("ID_Venta", "")).strip() in ids for r in self.almacen.leer("Ventas")[-cola:])
@@ -0,0 +1,74 @@
+"""Costos por SKU: lo comprado, lo vendido, la existencia y lo que cuesta cada unidad en dólares.
+
+Se calcula una vez por versión de datos (Modelo.costos) con un groupby sobre
+Inventario, en vez de filtrar la hoja producto por producto en cada pantalla.
+El costo unitario sale de dos formas: promedio ponderado de todas las compras
+y FIFO (lo que costaron las unidades que siguen en el depósito, gastando
+primero las compras más viejas). CAJA GENERAL e INVENTARIO solo consultan la
+tabla.
+"""
+import pandas as pd
+
+from esquema import Movimiento
+
+COLUMNAS = ["Comprado", "Vendido", "Stock", "Costo_Total_USD", "Costo_Promedio_USD", "Costo_FIFO_USD"]
+
+
+def costo_litro(df_c, tasa):
+    # Dólares por litro de la última cisterna (o ajuste) registrada; 0 si no hay
+    if df_c.empty: return 0.0
+    cisternas = df_c[df_c['Movimiento'].isin([Movimiento.CISTERNA, Movimiento.AJUSTE])]
+    if cisternas.empty: return 0.0
+    ultima = cisternas.sort_values(by=['Fecha'], ascending=False).iloc[0]
+    tasa_uc = ultima.get('Tasa_Cambio', tasa)
+    if pd.isna(tasa_uc) or tasa_uc <= 0: tasa_uc = tasa
+    return (ultima['Costo_Bs'] / tasa_uc) / ultima['Litros'] if ultima['Litros'] > 0 else 0.0
+
+
+def tabla_costos(df_i, vendidas):
+    """DataFrame indexado por SKU con COLUMNAS; `vendidas` = {sku: unidades vendidas} (Modelo.ventas_por_sku)."""
+    skus = list(vendidas)
+    if not df_i.empty and 'SKU_Calc' in df_i.columns:
+        compras = df_i[['SKU_Calc', 'FechaDT', 'Cantidad', 'Costo_USD']].copy()
+        compras['SKU_Calc'] = compras['SKU_Calc'].astype(str)
+        compras['Cantidad'] = compras['Cantidad'].fillna(0).astype(float)
+        skus += [s for s in compras['SKU_Calc'].unique() if s not in vendidas]
+    else: compras = pd.DataFrame(columns=['SKU_Calc', 'FechaDT', 'Cantidad', 'Costo_USD'])
+    tabla = pd.DataFrame(0.0, index=pd.Index(skus, name="SKU"), columns=COLUMNAS)
+    tabla['Vendido'] = pd.Series(vendidas, dtype=float).reindex(tabla.index).fillna(0.0)
+    if compras.empty:
+        tabla['Stock'] = -tabla['Vendido']
+        return tabla
+
+    por_sku = compras.groupby('SKU_Calc', sort=False)
+    tabla['Comprado'] = por_sku['Cantidad'].sum().reindex(tabla.index).fillna(0.0)
+    tabla['Costo_Total_USD'] = por_sku['Costo_USD'].sum().reindex(tabla.index).fillna(0.0)
+    tabla['Stock'] = tabla['Comprado'] - tabla['Vendido']
+    con_compras = tabla['Comprado'] > 0
+    tabla.loc[con_compras, 'Costo_Promedio_USD'] = tabla['Costo_Total_USD'] / tabla['Comprado']
+
+    # FIFO: lo vendido se descuenta de las compras en orden de fecha; lo que queda de cada compra conserva su costo
+    compras = compras.sort_values(['SKU_Calc', 'FechaDT'], kind='stable')
+    unitario = (compras['Costo_USD'] / compras['Cantidad']).where(compras['Cantidad'] > 0, 0.0)
+    acumulado = compras.groupby('SKU_Calc', sort=False)['Cantidad'].cumsum()
+    queda = (acumulado - compras['SKU_Calc'].map(tabla['Vendido'])).clip(lower=0).clip(upper=compras['Cantidad'])
+    valor = (queda * unitario).groupby(compras['SKU_Calc']).sum()
+    unidades = queda.groupby(compras['SKU_Calc']).sum()
+    fifo = (valor / unidades).where(unidades > 0)
+    # Sin existencia, vale lo que costó la última compra
+    fifo = fifo.fillna(unitario.groupby(compras['SKU_Calc']).last())
+    tabla['Costo_FIFO_USD'] = fifo.reindex(tabla.index).fillna(0.0)
+    return tabla
+
+
+def costos_productos(productos, tabla, litro_usd, sku_tapa):
+    # {producto: costo en dólares}: agua (litros × costo del litro) más el envase y la tapa del botellón nuevo
+    promedio = tabla['Costo_Promedio_USD'].to_dict()
+    costos = {}
+    for nombre, data in productos.items():
+        costo, n = data['litros'] * litro_usd if data['litros'] > 0 else 0.0, nombre.lower()
+        if 'botellón' in n and 'recarga' not in n:
+            costo += promedio.get(data['codigo'], 0.0) + (promedio.get(sku_tapa, 0.0) if sku_tapa else 0.0)
+        elif 'tapa' in n: costo += promedio.get(data['codigo'], 0.0)
+        costos[nombre] = costo
+    return costos
@@ -0,0 +1,102 @@
+"""Cliente de Sheets que respeta la cuota por minuto de la API.
+
+Se instala sobre HTTPClient.request de gspread (por ahí pasa toda llamada):
+- lecturas idénticas simultáneas (mismo GET con los mismos parámetros) viajan
+  una sola vez y todas reciben la misma respuesta;
+- una cubeta de fichas por tipo (lecturas y escrituras) frena antes de pasarse
+  de la cuota; si la espera sería larga se lanza CuotaAgotada en vez de colgar
+  el rerun (CacheHojas sirve entonces la última copia buena);
+- 429 y errores 5xx/de red se reintentan con espera exponencial con jitter
+  (las escrituras solo ante 429: un 5xx pudo haberlas aplicado).
+"""
+import random
+import threading
+import time
+
+import requests
+from gspread.exceptions import APIError
+
+from metricas import contar
+
+REINTENTABLES = {429, 500, 502, 503, 504}
+
+
+class CuotaAgotada(Exception):
+    pass
+
+
+class Cubeta:
+    # Cubeta de fichas: `capacidad` llamadas seguidas como máximo, y se rellena a `por_minuto` / 60 fichas por segundo
+    def __init__(self, por_minuto, capacidad=None):
+        self.ritmo = por_minuto / 60.0
+        self.capacidad = float(capacidad or por_minuto)
+        self.fichas = self.capacidad
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def tomar(self, espera_max):
+        # Reserva una ficha y devuelve los segundos a esperar por ella; None si serían más de espera_max
+        with self._lock:
+            ahora = time.monotonic()
+            self.fichas = min(self.capacidad, self.fichas + (ahora - self._t) * self.ritmo)
+            self._t = ahora
+            espera = 0.0 if self.fichas >= 1 else (1 - self.fichas) / self.ritmo
+            if espera > espera_max: return None
+            self.fichas -= 1
+            return espera
+
+
+class _EnVuelo:
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta = self.error = None
+
+
+class ClienteCuota:
+    def __init__(self, cliente, lecturas_por_minuto=60, escrituras_por_minuto=60, reintentos=3, espera_max=2.0, base=1.0):
+        self.cubetas = {"lectura": Cubeta(lecturas_por_minuto), "escritura": Cubeta(escrituras_por_minuto)}
+        self.reintentos = reintentos
+        self.espera_max = espera_max
+        self.base = base
+        self._pedir = cliente.request
+        self._en_vuelo = {}
+        self._lock = threading.Lock()
+        cliente.request = self.request
+
+    def request(self, method, endpoint, params=None, **kwargs):
+        if method.lower() != "get" or kwargs.get("data") or kwargs.get("json"): return self._llamar("escritura", method, endpoint, params, kwargs)
+
+        clave = (endpoint, repr(sorted((params or {}).items())))
+        with self._lock:
+            vuelo = self._en_vuelo.get(clave)
+            lider = vuelo is None
+            if lider: vuelo = self._en_vuelo[clave] = _EnVuelo()
+        if not lider:
+            # Ya hay una lectura idéntica en camino: se espera su respuesta en vez de gastar otra ficha
+            vuelo.listo.wait()
+            if vuelo.error is not None: raise vuelo.error
+            return vuelo.respuesta
+        try:
+            vuelo.respuesta = self._llamar("lectura", method, endpoint, params, kwargs)
+            return vuelo.respuesta
+        except Exception as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock: self._en_vuelo.pop(clave, None)
+            vuelo.listo.set()
+
+    def _llamar(self, tipo, method, endpoint, params, kwargs):
+        for intento in range(self.reintentos + 1):
+            espera = self.cubetas[tipo].tomar(self.espera_max)
+            if espera is None: raise CuotaAgotada(f"Cuota de {tipo}s de Google Sheets agotada; reintenta en unos segundos")
+            if espera: time.sleep(espera)
+            try:
+                contar("sheets")
+                return self._pedir(method, endpoint, params=params, **kwargs)
+            except APIError as e:
+                codigo = getattr(e, "code", None)
+                if intento == self.reintentos or codigo not in REINTENTABLES or (tipo == "escritura" and codigo != 429): raise
+            except (requests.ConnectionError, requests.Timeout):
+                if intento == self.reintentos or tipo == "escritura": raise
+            time.sleep(min(30.0, self.base * 2 ** intento) * random.uniform(0.5, 1.5))
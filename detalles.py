@@ -0,0 +1,90 @@
+"""Desglose de Detalles_Compra en una tabla de renglones (un producto vendido por fila).
+
+"2x Recarga Botellón 20L, 1x Tapas (Cliente: Ana)" se convierte en dos renglones
+con su cantidad, SKU y litros, marcados como pendientes/anulados según la columna
+de estado de la venta. Todos los conteos por producto salen de esta tabla.
+"""
+import re
+
+import pandas as pd
+
+COLUMNAS = ["Fila", "FechaDT", "Producto", "SKU", "Cantidad", "Litros", "Pendiente", "Anulada"]
+
+# Sufijos que el cobro agrega al final del texto: "(Cliente: ...)" y "(Cobro incl. Pendientes)"
+_SUFIJO = r"\s*\((?:Cliente:|Cobro incl\.)[^()]*\)\s*$"
+_RENGLON = r"^\s*(\d+)x (.+?)\s*$"
+_CLIENTE = re.compile(r"\(Cliente:\s*([^()]*)\)\s*$")
+
+
+def _vacia():
+    return pd.DataFrame({"Fila": pd.Series(dtype="int64"), "FechaDT": pd.Series(dtype="datetime64[ns]"),
+                         "Producto": pd.Series(dtype=object), "SKU": pd.Series(dtype=object),
+                         "Cantidad": pd.Series(dtype="int64"), "Litros": pd.Series(dtype="float64"),
+                         "Pendiente": pd.Series(dtype=bool), "Anulada": pd.Series(dtype=bool)})
+
+
+def tabla_items(ventas, productos):
+    # ventas: DataFrame crudo de la hoja; su índice es la posición de la fila (fila de hoja = índice + 2)
+    if ventas.empty or "Detalles_Compra" not in ventas.columns: return _vacia()
+
+    det = ventas["Detalles_Compra"].astype(str)
+    det = det[~det.str.startswith("Vuelto")]  # los vueltos repiten el texto del ticket original
+    renglones = det.str.replace(_SUFIJO, "", regex=True).str.split(", ").explode()
+    partes = renglones.str.extract(_RENGLON).dropna()
+    if partes.empty: return _vacia()
+
+    items = pd.DataFrame({"Fila": partes.index + 2, "Producto": partes[1].values,
+                          "Cantidad": partes[0].astype(int).values})
+    fechas = ventas["FechaDT"] if "FechaDT" in ventas.columns else pd.to_datetime(ventas["Fecha"], errors="coerce")
+    items["FechaDT"] = fechas.reindex(partes.index).values
+    items["SKU"] = items["Producto"].map({n: d["codigo"] for n, d in productos.items()})
+    items["Litros"] = items["Producto"].map({n: d["litros"] for n, d in productos.items()}).fillna(0) * items["Cantidad"]
+
+    if "Anulada" in ventas.columns:
+        # Frame ya tipado (esquema.tipar): las banderas vienen calculadas
+        items["Pendiente"] = ventas["Pendiente"].reindex(partes.index).values
+        items["Anulada"] = ventas["Anulada"].reindex(partes.index).values
+    elif len(ventas.columns) >= 11:
+        estado = ventas[ventas.columns[10]].astype(str).reindex(partes.index)
+        items["Pendiente"] = estado.str.strip().str.upper().eq("PENDIENTE").values
+        items["Anulada"] = estado.str.contains("ANULADA", case=False, na=False).values
+    else:
+        items["Pendiente"] = False; items["Anulada"] = False
+    return items[COLUMNAS]
+
+
+def cliente_de(texto):
+    m = _CLIENTE.search(str(texto))
+    return m.group(1).strip() if m else ""
+
+
+def renglones(texto):
+    # "2x Recarga Botellón 20L, 1x Tapas (Cliente: Ana)" -> {"Recarga Botellón 20L": 2, "Tapas": 1}
+    items = {}
+    for parte in re.sub(_SUFIJO, "", str(texto)).split(", "):
+        m = re.match(_RENGLON, parte)
+        if m: items[m.group(2)] = items.get(m.group(2), 0) + int(m.group(1))
+    return items
+
+
+def texto_renglones(items):
+    return ", ".join(f"{q}x {p}" for p, q in items.items() if q > 0)
+
+
+def sku_de_tapa(productos):
+    sku_tapa = None
+    for n, d in productos.items():
+        if "tapa" in n.lower(): sku_tapa = d["codigo"]
+    return sku_tapa
+
+
+def unidades_por_sku(items, productos):
+    ventas_por_sku = {d["codigo"]: 0 for d in productos.values()}
+    sku_tapa = sku_de_tapa(productos)
+    vivos = items[~items["Anulada"] & items["SKU"].notna()]
+    for sku, cant in vivos.groupby("SKU")["Cantidad"].sum().items(): ventas_por_sku[sku] = int(cant)
+    if sku_tapa:
+        # Cada botellón nuevo (no recarga) sale con su tapa
+        nombre = vivos["Producto"].str.lower()
+        ventas_por_sku[sku_tapa] += int(vivos.loc[nombre.str.contains("botellón") & ~nombre.str.contains("recarga"), "Cantidad"].sum())
+    return ventas_por_sku
@@ -0,0 +1,110 @@
+"""Esquema declarado de las hojas de movimientos (Ventas, Cargas e Inventario).
+
+Cada hoja se convierte una sola vez en un DataFrame tipado: fechas y horas con
+formato explícito, montos y litros como float, las columnas repetitivas como categorías
+y banderas y enums ya calculados (anulada, pendiente, tipo de movimiento). Así
+las pantallas filtran con comparaciones en vez de expresiones regulares. El
+método de pago se clasifica aquí una vez por texto (metodo_de) y los totales
+diarios suman por ese enum.
+"""
+import re
+from enum import IntEnum
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+FORMATO_FECHA = "%Y-%m-%d"
+FORMATO_HORA = "%H:%M:%S"
+
+
+class Metodo(IntEnum):
+    OTRO = 0  # Adelantado y cualquier texto desconocido
+    MOVIL = 1
+    EFECTIVO = 2
+    PUNTO = 3
+    DIVISA = 4
+
+
+class Movimiento(IntEnum):
+    CISTERNA = 0
+    AJUSTE = 1  # calibraciones del tanque
+    GASTO = 2
+    DEPOSITO = 3
+
+
+# Tipo de cada columna: "categoria" o un dtype numérico ("Int64" = unidades enteras); las demás quedan como texto
+ESQUEMAS = {
+    "Ventas": {"Vendedor": "categoria", "Monto": "float64", "Moneda": "categoria", "Tasa_Cambio": "float64",
+               "Metodo_Pago": "categoria", "Total_Litros": "float32"},
+    "Cargas": {"Litros": "float64", "Costo_Divisa": "float64", "Tasa_Cambio": "float64"},
+    "Inventario": {"Cantidad": "Int64", "Costo_Bs": "float64", "Tasa_Cambio": "float64"},
+}
+
+
+# Mismos criterios que usaban las pantallas con str.contains; gana el primero que coincide
+METODOS = ((Metodo.MOVIL, re.compile(r"Móvil|Movil", re.I)), (Metodo.EFECTIVO, re.compile(r"Efectivo|Bs", re.I)),
+           (Metodo.PUNTO, re.compile(r"Punto", re.I)), (Metodo.DIVISA, re.compile(r"Divisa|\$", re.I)))
+
+
+@lru_cache(maxsize=256)
+def metodo_de(texto):
+    # Texto de Metodo_Pago -> Metodo (hay pocos textos distintos: cada uno se clasifica una vez)
+    for metodo, rx in METODOS:
+        if rx.search(texto): return metodo
+    return Metodo.OTRO
+
+
+def movimiento_de(concepto):
+    c = str(concepto).upper()
+    if "DEPÓSITO" in c: return Movimiento.DEPOSITO
+    if "GASTO" in c: return Movimiento.GASTO
+    if "CALIBRACIÓN" in c: return Movimiento.AJUSTE
+    return Movimiento.CISTERNA
+
+
+def por_categoria(serie, funcion, dtype):
+    # Aplica `funcion` una vez por categoría y reparte el resultado por los códigos (vacíos -> funcion(""))
+    cats = serie.cat.categories
+    valores = np.array([funcion(c) for c in cats] + [funcion("")], dtype=dtype)
+    return pd.Series(valores[serie.cat.codes.to_numpy()], index=serie.index)
+
+
+def fechas(serie):
+    txt = serie.astype(str).str.strip()
+    f = pd.to_datetime(txt.str.slice(0, 10), format=FORMATO_FECHA, errors="coerce")
+    raras = f.isna() & txt.ne("")
+    if raras.any(): f[raras] = pd.to_datetime(txt[raras], errors="coerce")  # fechas escritas a mano en otro formato
+    return f
+
+
+def horas(serie):
+    # Hora del día como timedelta (NaT si no es H:MM:SS)
+    txt = serie.astype(str).str.strip()
+    return pd.to_datetime(txt, format=FORMATO_HORA, errors="coerce") - pd.Timestamp("1900-01-01")
+
+
+def tipar(hoja, registros):
+    df = pd.DataFrame(registros)
+    if df.empty: return df
+    for col, tipo in ESQUEMAS.get(hoja, {}).items():
+        if col not in df.columns: continue
+        if tipo == "categoria": df[col] = df[col].astype(str).astype("category")
+        else:
+            num = pd.to_numeric(df[col], errors="coerce")
+            df[col] = (num.round() if tipo == "Int64" else num).astype(tipo)
+    if "Fecha" in df.columns: df["FechaDT"] = fechas(df["Fecha"])
+    if "Hora" in df.columns: df["HoraDT"] = horas(df["Hora"])
+
+    if hoja == "Ventas":
+        if len(registros[0]) >= 11:
+            # La columna K es el estado, se llame como se llame
+            col = df.columns[10]
+            df[col] = df[col].astype(str).astype("category")
+            df["Anulada"] = por_categoria(df[col], lambda e: "ANULADA" in e.upper(), bool)
+            df["Pendiente"] = por_categoria(df[col], lambda e: e.strip().upper() == "PENDIENTE", bool)
+    elif hoja == "Cargas":
+        # Sin columna de notas todo cuenta como cisterna, igual que una nota vacía
+        notas = df["Notas"] if "Notas" in df.columns else pd.Series("", index=df.index)
+        df["Movimiento"] = notas.map({n: int(movimiento_de(n)) for n in notas.unique()}).astype("int8")
+    return df
@@ -0,0 +1,124 @@
+"""Exportación de un rango de fechas de Ventas (con sus renglones), Cargas e Inventario a CSV o Parquet.
+
+Las filas se recorren en tramos: los meses archivados se leen del Parquet por
+lotes y las filas vivas se cortan de la copia que ya está en memoria. Cada tramo
+se tipa, se filtra por fecha y se escribe al archivo de salida antes de pasar al
+siguiente, así exportar un año ocupa la memoria de un tramo y no la de la hoja
+completa. Las columnas salen con los nombres de almacen.ENCABEZADOS (por
+posición, como las lee la app) y los renglones de cada venta van en
+Ventas_renglones con su ID_Venta.
+
+Uso por consola:
+    python exportar.py 2026-01-01 2026-12-31 carpeta_destino [csv|parquet]
+"""
+import os
+import shutil
+import sys
+import tempfile
+import zipfile
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from almacen import ENCABEZADOS
+from archivo import HOJAS_ARCHIVO
+from detalles import tabla_items
+from esquema import ESQUEMAS, tipar
+
+TRAMO = 20000  # filas por tramo
+COLUMNAS_RENGLONES = ["Fecha", "Hora", "ID_Venta", "Producto", "SKU", "Cantidad", "Litros", "Pendiente", "Anulada"]
+FORMATOS = ("csv", "parquet")
+
+
+def _tramos(archivo, hoja, vivos, desde, hasta, tramo):
+    # Registros de la hoja en tramos de a lo sumo `tramo`: primero los meses archivados del rango, después los vivos
+    if archivo is not None: yield from archivo.tramos(hoja, f"{desde:%Y-%m}", f"{hasta:%Y-%m}", tramo)
+    for i in range(0, len(vivos), tramo): yield vivos[i:i + tramo]
+
+
+def _columnas(hoja, df):
+    # Tipos fijos por columna para que todos los tramos escriban el mismo esquema
+    df = df.reindex(columns=ENCABEZADOS[hoja])
+    for col in df.columns:
+        tipo = ESQUEMAS.get(hoja, {}).get(col)
+        if tipo in ("float64", "float32", "Int64"): df[col] = pd.to_numeric(df[col], errors="coerce").astype("float64" if tipo != "Int64" else "Int64")
+        else: df[col] = df[col].astype(object).where(df[col].notna(), "").astype(str)
+    return df
+
+
+class _Salida:
+    # Un archivo de salida que se va llenando tramo a tramo (el primero fija las columnas y sus tipos)
+    def __init__(self, ruta, formato):
+        self.ruta, self.formato = ruta, formato
+        self.filas, self.abierta, self._escritor = 0, False, None
+
+    def escribir(self, df):
+        if self.formato == "csv": df.to_csv(self.ruta, mode="a" if self.abierta else "w", header=not self.abierta, index=False)
+        else:
+            tabla = pa.Table.from_pandas(df, preserve_index=False, schema=self._escritor.schema if self._escritor else None)
+            if self._escritor is None: self._escritor = pq.ParquetWriter(self.ruta, tabla.schema)
+            self._escritor.write_table(tabla)
+        self.abierta = True
+        self.filas += len(df)
+
+    def cerrar(self):
+        if self.formato == "parquet" and self._escritor is not None: self._escritor.close()
+
+
+def exportar(archivo, vivas, productos, desde, hasta, carpeta, formato="csv", tramo=TRAMO):
+    """Escribe <Hoja>.<formato> de Ventas, Cargas e Inventario y Ventas_renglones.<formato> con las filas
+    entre `desde` y `hasta` (fechas, inclusive). `vivas` = {hoja: registros del libro}. Devuelve {nombre: filas}."""
+    if formato not in FORMATOS: raise ValueError(f"Formato desconocido: {formato} (usa {' o '.join(FORMATOS)})")
+    os.makedirs(carpeta, exist_ok=True)
+    inicio, fin = pd.Timestamp(desde), pd.Timestamp(hasta)
+    salidas = {n: _Salida(os.path.join(carpeta, f"{n}.{formato}"), formato) for n in HOJAS_ARCHIVO + ("Ventas_renglones",)}
+    try:
+        for hoja in HOJAS_ARCHIVO:
+            cols = ENCABEZADOS[hoja]
+            for registros in _tramos(archivo, hoja, vivas.get(hoja, []), desde, hasta, tramo):
+                # Por posición, como los lee la app (la columna K es el estado se llame como se llame)
+                df = tipar(hoja, [dict(zip(cols, r.values())) for r in registros])
+                if df.empty: continue
+                df = df[(df["FechaDT"] >= inicio) & (df["FechaDT"] <= fin)].reset_index(drop=True)
+                if df.empty: continue
+                salida = _columnas(hoja, df)
+                salidas[hoja].escribir(salida)
+                if hoja == "Ventas":
+                    items = tabla_items(df, productos)
+                    fila = items["Fila"] - 2
+                    for col in ("Fecha", "Hora", "ID_Venta"): items[col] = salida[col].reindex(fila).values
+                    items["Cantidad"] = items["Cantidad"].astype("int64"); items["Litros"] = items["Litros"].astype("float64")
+                    items["SKU"] = items["SKU"].astype(object).where(items["SKU"].notna(), "").astype(str)
+                    if not items.empty: salidas["Ventas_renglones"].escribir(items[COLUMNAS_RENGLONES].reset_index(drop=True))
+        # Un rango sin filas igual deja cada archivo con sus columnas
+        for nombre, s in salidas.items():
+            if not s.abierta: s.escribir(_columnas(nombre, pd.DataFrame()) if nombre in ENCABEZADOS else pd.DataFrame({c: pd.Series(dtype=str) for c in COLUMNAS_RENGLONES}))
+    finally:
+        for s in salidas.values(): s.cerrar()
+    return {n: s.filas for n, s in salidas.items()}
+
+
+def exportar_zip(archivo, vivas, productos, desde, hasta, destino, formato="csv"):
+    # Exporta a una carpeta temporal propia y la comprime, archivo por archivo, en `destino` (ruta o archivo abierto);
+    # la carpeta se borra al terminar. Devuelve {nombre: filas}
+    carpeta = tempfile.mkdtemp(prefix="agua_export_")
+    try:
+        filas = exportar(archivo, vivas, productos, desde, hasta, carpeta, formato)
+        with zipfile.ZipFile(destino, "w", zipfile.ZIP_DEFLATED) as z:
+            for nombre in sorted(os.listdir(carpeta)): z.write(os.path.join(carpeta, nombre), nombre)
+        return filas
+    finally: shutil.rmtree(carpeta, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (4, 5) or (len(sys.argv) == 5 and sys.argv[4] not in FORMATOS):
+        sys.exit("Uso: python exportar.py AAAA-MM-DD AAAA-MM-DD carpeta_destino [csv|parquet]")
+    from archivo import conectar
+    from modelo import procesar_maestros
+    almacen, archivo = conectar()
+    productos, _ = procesar_maestros(almacen.leer("Productos"), almacen.leer("Configuracion"))
+    filas = exportar(archivo, {h: almacen.leer(h) for h in HOJAS_ARCHIVO}, productos, date.fromisoformat(sys.argv[1]), date.fromisoformat(sys.argv[2]),
+                     sys.argv[3], sys.argv[4] if len(sys.argv) == 5 else "csv")
+    print("✅ " + ", ".join(f"{n}: {q} filas" for n, q in filas.items()))
@@ -0,0 +1,84 @@
+"""Miniaturas del catálogo de productos.
+
+Las fotos originales (de 1024 a 2048 px, hasta 2 MB) se reducen una sola vez
+al tamaño de la tarjeta y se guardan como PNG de paleta, identificadas por el
+hash del archivo. Los bytes quedan en una memoria acotada, y el mapa
+producto → miniatura se arma una vez por versión del catálogo.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+# La tarjeta del carrusel mide 145 px; se guarda al doble para pantallas de alta densidad
+ANCHO_MINIATURA = 290
+
+
+class Miniaturas:
+    def __init__(self, carpeta, ancho=ANCHO_MINIATURA, max_bytes=8 * 1024 * 1024, carpeta_disco=None):
+        self.carpeta = carpeta
+        self.ancho = ancho
+        self.max_bytes = max_bytes
+        self.carpeta_disco = carpeta_disco or os.path.join(carpeta, ".miniaturas")
+        self._memoria = OrderedDict()  # hash -> bytes, la más usada al final
+        self._bytes = 0
+        self._hashes = {}  # ruta -> ((mtime, tamaño), hash)
+        self._lock = threading.Lock()
+
+    def resolver(self, nombre, defecto):
+        # Ruta de la imagen del producto, o la de por defecto si no existe
+        for n in (nombre, defecto):
+            if n and os.path.isfile(os.path.join(self.carpeta, n)): return os.path.join(self.carpeta, n)
+        return None
+
+    def _hash(self, ruta):
+        st = os.stat(ruta)
+        firma = (st.st_mtime_ns, st.st_size)
+        previo = self._hashes.get(ruta)
+        if previo and previo[0] == firma: return previo[1]
+        with open(ruta, "rb") as f: h = hashlib.sha1(f.read()).hexdigest()
+        self._hashes[ruta] = (firma, h)
+        return h
+
+    def _generar(self, ruta):
+        from PIL import Image
+        with Image.open(ruta) as img:
+            img = img.convert("RGBA")
+            img.thumbnail((self.ancho, self.ancho * 4), Image.LANCZOS)
+            # PNG de 256 colores: st.image lo sirve tal cual (otros formatos los vuelve a codificar en cada rerun)
+            img = img.quantize(256, method=Image.Quantize.FASTOCTREE)
+            buf = io.BytesIO()
+            img.save(buf, "PNG", optimize=True)
+        return buf.getvalue()
+
+    def miniatura(self, ruta):
+        if not ruta: return None
+        try: h = self._hash(ruta)
+        except OSError: return None
+        with self._lock:
+            if h in self._memoria:
+                self._memoria.move_to_end(h)
+                return self._memoria[h]
+
+        en_disco = os.path.join(self.carpeta_disco, f"{h}_{self.ancho}.png")
+        try:
+            with open(en_disco, "rb") as f: datos = f.read()
+        except OSError:
+            try: datos = self._generar(ruta)
+            except Exception: return ruta  # sin Pillow o imagen que no se pudo reducir: se muestra el original
+            try:
+                os.makedirs(self.carpeta_disco, exist_ok=True)
+                with open(en_disco, "wb") as f: f.write(datos)
+            except OSError: pass  # sin permiso de escritura: queda solo en memoria
+
+        with self._lock:
+            if h not in self._memoria:
+                self._memoria[h] = datos; self._bytes += len(datos)
+                while self._bytes > self.max_bytes and len(self._memoria) > 1:
+                    self._bytes -= len(self._memoria.popitem(last=False)[1])
+        return datos
+
+    def catalogo(self, productos, defecto):
+        # nombre del producto -> bytes de su miniatura, la ruta del original si no se pudo reducir, None si no hay ninguna imagen
+        return {n: self.miniatura(self.resolver(str(d.get("imagen", "")).strip(), defecto)) for n, d in productos.items()}
@@ -0,0 +1,112 @@
+"""Tiempos de cada rerun por fase y conteo de llamadas a la API de Sheets.
+
+Cada rerun abre una Corrida que va marcando fases consecutivas (auth, datos,
+proceso, la sección dibujada). Las lecturas de cada hoja y las escrituras se
+suman como sub-tiempos desde donde ocurren con medir(); la corrida activa es la
+del hilo que ejecuta el script, así no hay que pasarla de mano en mano. Las
+últimas corridas quedan en memoria para sacar p50/p95, pueden salir como líneas
+JSON en el log y, a pedido, una corrida se graba con cProfile.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+
+log = logging.getLogger("agua.metricas")
+_hilo = threading.local()
+
+
+def actual():
+    return getattr(_hilo, "corrida", None)
+
+
+@contextmanager
+def medir(nombre):
+    # Suma el tiempo del bloque a la corrida activa (si no hay ninguna, no hace nada)
+    c, t0 = actual(), time.perf_counter()
+    try: yield
+    finally:
+        if c is not None: c.detalle[nombre] = c.detalle.get(nombre, 0.0) + (time.perf_counter() - t0) * 1000
+
+
+def contar(api="sheets"):
+    c = actual()
+    if c is not None: c.llamadas[api] += 1
+
+
+def _percentil(valores, p):
+    v = sorted(valores)
+    return v[min(len(v) - 1, max(0, round(p / 100 * len(v) + 0.5) - 1))]
+
+
+class Corrida:
+    def __init__(self, perfilar=False):
+        self.momento = datetime.now()
+        self.inicio = self._fin = self._desde = time.perf_counter()
+        self.fases = {}  # fase del script -> ms (consecutivas, suman el total)
+        self.detalle = {}  # sub-tiempos dentro de las fases: "hoja Ventas", "escritura"...
+        self.llamadas = Counter()
+        self.seccion = None
+        self.cerrada = False
+        self._fase = None
+        self.perfil = cProfile.Profile() if perfilar else None
+        if self.perfil: self.perfil.enable()
+
+    def marcar(self, fase):
+        # Cierra la fase abierta y abre `fase` (None = solo cerrar)
+        ahora = time.perf_counter()
+        if self._fase:
+            self.fases[self._fase] = self.fases.get(self._fase, 0.0) + (ahora - self._desde) * 1000
+            self._fin = ahora
+        self._fase, self._desde = fase, ahora
+
+    def registro(self):
+        return {"momento": self.momento.isoformat(timespec="seconds"), "seccion": self.seccion, "total_ms": round((self._fin - self.inicio) * 1000, 1),
+                "fases": {k: round(v, 1) for k, v in self.fases.items()}, "detalle": {k: round(v, 1) for k, v in self.detalle.items()},
+                "llamadas": dict(self.llamadas)}
+
+
+class Metricas:
+    # Ventana de las últimas corridas de todas las sesiones (vive en st.cache_resource)
+    def __init__(self, ventana=300, log_json=False):
+        self.corridas = deque(maxlen=ventana)
+        self.log_json = log_json
+        self.perfil = None  # (momento, sección, texto de pstats) de la última corrida perfilada
+        self._lock = threading.Lock()
+
+    def iniciar(self, previa=None, perfilar=False):
+        # Una corrida cortada por st.stop()/st.rerun() no llegó a terminar(): se cierra con lo que alcanzó a marcar
+        if previa is not None and not previa.cerrada: self.terminar(previa)
+        _hilo.corrida = Corrida(perfilar)
+        return _hilo.corrida
+
+    def terminar(self, corrida):
+        if corrida.cerrada: return
+        corrida.marcar(None); corrida.cerrada = True
+        if actual() is corrida: _hilo.corrida = None
+        if corrida.perfil:
+            corrida.perfil.disable()
+            buf = io.StringIO()
+            pstats.Stats(corrida.perfil, stream=buf).sort_stats("cumulative").print_stats(40)
+            self.perfil = (corrida.momento, corrida.seccion, buf.getvalue())
+            corrida.perfil = None
+        fila = corrida.registro()
+        with self._lock: self.corridas.append(fila)
+        if self.log_json: log.info(json.dumps(fila, ensure_ascii=False))
+
+    def resumen(self, seccion=None):
+        # [{Medida, Corridas, p50 ms, p95 ms}] de las fases, sub-tiempos, total y llamadas a la API por corrida
+        with self._lock: filas = [f for f in self.corridas if seccion is None or f["seccion"] == seccion]
+        valores = {}
+        for f in filas:
+            valores.setdefault("TOTAL", []).append(f["total_ms"])
+            for k, v in f["fases"].items(): valores.setdefault(k, []).append(v)
+            for k, v in f["detalle"].items(): valores.setdefault(f"  {k}", []).append(v)
+            valores.setdefault("llamadas Sheets", []).append(f["llamadas"].get("sheets", 0))
+        return [{"Medida": k, "Corridas": len(v), "p50": round(_percentil(v, 50), 1), "p95": round(_percentil(v, 95), 1)} for k, v in valores.items()]
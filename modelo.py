@@ -0,0 +1,181 @@
+"""Datos derivados de las hojas, calculados a demanda y una sola vez por versión.
+
+Cada rerun de Streamlit pide solo lo que la sección elegida necesita (VENDER
+usa el catálogo, la tasa y el tanque; DIARIO el resumen diario, etc.). Las
+tablas quedan memorizadas en el Modelo de esa versión de datos.
+"""
+from functools import cached_property
+
+import pandas as pd
+
+from almacen import id_venta
+from costos import costo_litro, costos_productos, tabla_costos
+from detalles import cliente_de, renglones, sku_de_tapa, tabla_items, unidades_por_sku
+from esquema import tipar
+from resumenes import sumar
+from tasas import en_dolares, tabla_tasas
+
+
+def procesar_maestros(datos_prod, datos_conf):
+    productos = {}
+    for f in datos_prod:
+        nombre = str(f.get('Producto', '')).strip()
+        if not nombre: continue
+        codigo = str(f.get('Código_SKU', f.get('Código (SKU)', f.get('Codigo', f.get('SKU', nombre))))).strip()
+        pr = float(str(f.get('Precio_Actual', 0)).replace(',', '.'))
+        l = float(str(f.get('Litros', 0)).replace(',', '.'))
+        categoria = str(f.get('Categoria', f.get('Categoría', '💧 Productos Generales'))).strip()
+        imagen = str(f.get('Imagen', f.get('imagen', ''))).strip()
+        ctrl_keys = [k for k in f.keys() if 'controla' in k.lower()]
+        controla = str(f.get(ctrl_keys[0], 'NO')).strip().upper() in ['SI', 'SÍ', 'YES', 'TRUE'] if ctrl_keys else False
+        productos[nombre] = {"precio": pr, "litros": l, "codigo": codigo, "controla_stock": controla, "categoria": categoria, "imagen": imagen}
+    tasa = 60.0
+    for c in datos_conf:
+        if str(c.get('Parametro', '')).strip() == "TASA_DIA":
+            try: tasa = float(str(c.get('Valor', 0)).replace(',', '.'))
+            except: pass
+    return productos, tasa
+
+
+def calcular_stock(c, df_v):
+    # c = registros de Cargas; df_v = Ventas ya tipada (esquema.tipar), con sus banderas Anulada/Pendiente
+    df_cargas = pd.DataFrame(c)
+    ent = pd.to_numeric(df_cargas['Litros'], errors='coerce').sum() if not df_cargas.empty and 'Litros' in df_cargas.columns else 0
+    sal = 0
+    if not df_v.empty and 'Total_Litros' in df_v.columns:
+        if 'Anulada' in df_v.columns:
+            # Excluimos del gasto de agua los Pendientes y los ANULADOS
+            sal = df_v.loc[~(df_v['Anulada'] | df_v['Pendiente']), 'Total_Litros'].sum()
+        else:
+            sal = df_v['Total_Litros'].sum()
+    return ent - float(sal)
+
+
+class Modelo:
+    def __init__(self, version, crudos, resumen=None, tanque=None, historico=None):
+        self.version = version
+        self.d_prod, self.d_conf, self.d_cargas, self.d_ventas, self.d_inv = crudos
+        self._resumen = resumen
+        self._tanque = tanque
+        self._historico = historico if historico is not None and not historico.vacio else None
+
+    # --- MAESTROS (los necesita toda la app) ---
+    @cached_property
+    def maestros(self):
+        return procesar_maestros(self.d_prod, self.d_conf)
+
+    @property
+    def productos(self): return self.maestros[0]
+
+    @property
+    def tasa(self): return max(self.maestros[1], 1.0)
+
+    @cached_property
+    def tanque(self):
+        return self._tanque.actualizar(self.version, self.d_cargas, self.d_ventas)
+
+    @cached_property
+    def stock(self):
+        # Con libro del tanque el nivel ya está acumulado; sin él se suma todo como antes
+        if self._tanque is None: return calcular_stock(self.d_cargas, self.df_v_bruto)
+        return self.tanque.nivel
+
+    # --- TABLAS ---
+    @cached_property
+    def df_v_bruto(self):
+        # Tipado una sola vez (esquema.py): fechas, montos, categorías y las banderas Anulada/Pendiente
+        return tipar("Ventas", self.d_ventas)
+
+    @cached_property
+    def df_v(self):
+        df_v_bruto = self.df_v_bruto
+        if df_v_bruto.empty or 'Monto' not in df_v_bruto.columns: return pd.DataFrame()
+        # Filtro mágico: Si dice "ANULADA", la borramos de la memoria temporal para que no sume en ningún reporte
+        df_v = df_v_bruto[~df_v_bruto['Anulada']].copy() if 'Anulada' in df_v_bruto.columns else df_v_bruto.copy()
+        df_v['Monto'] = df_v['Monto'].fillna(0)
+        # ID estable de cada venta (las viejas sin ID_Venta se identifican por su fila)
+        df_v['ID'] = [id_venta(self.d_ventas[i], i) for i in df_v.index]
+        return df_v
+
+    @cached_property
+    def df_c(self):
+        # Cargas e Inventario son hojas cortas: las filas archivadas se suman enteras
+        df_c = tipar("Cargas", (self._historico.cargas if self._historico else []) + self.d_cargas)
+        if not df_c.empty:
+            df_c.rename(columns={'Costo_Divisa': 'Costo_Bs', 'Notas': 'Concepto'}, inplace=True)
+            df_c['Costo_Bs'] = df_c['Costo_Bs'].fillna(0)
+        return df_c
+
+    @cached_property
+    def df_i(self):
+        df_i = tipar("Inventario", (self._historico.inventario if self._historico else []) + self.d_inv)
+        if not df_i.empty:
+            sku_col = next((col for col in df_i.columns if 'código' in col.lower() or 'sku' in col.lower() or 'codigo' in col.lower()), 'Item')
+            df_i.rename(columns={sku_col: 'SKU_Calc'}, inplace=True)
+            if 'SKU_Calc' in df_i.columns: df_i['SKU_Calc'] = df_i['SKU_Calc'].astype(str).str.strip().astype('category')
+            df_i['Costo_USD'] = df_i['Costo_Bs'].fillna(0) / df_i['Tasa_Cambio'].fillna(self.tasa).replace(0, 1)
+        return df_i
+
+    # --- DERIVADOS ---
+    @cached_property
+    def items(self):
+        # Renglones de Detalles_Compra ya desglosados (uno por producto)
+        return tabla_items(self.df_v_bruto, self.productos)
+
+    @cached_property
+    def sku_tapa(self):
+        return sku_de_tapa(self.productos)
+
+    @cached_property
+    def ventas_por_sku(self):
+        items = self.items
+        if self._historico:
+            # Lo vendido en los meses archivados entra ya sumado por producto
+            u = self._historico.unidades()
+            arch = pd.DataFrame({"Producto": list(u.keys()), "Cantidad": list(u.values()), "Anulada": False})
+            arch["SKU"] = arch["Producto"].map(lambda p: self.productos.get(p, {}).get("codigo"))
+            items = pd.concat([items, arch], ignore_index=True)
+        return unidades_por_sku(items, self.productos)
+
+    @cached_property
+    def costo_litro(self):
+        return costo_litro(self.df_c, self.tasa)
+
+    @cached_property
+    def costos(self):
+        # Por SKU: comprado, vendido, stock y costo unitario en dólares (promedio y FIFO)
+        return tabla_costos(self.df_i, self.ventas_por_sku)
+
+    @cached_property
+    def costo_productos(self):
+        # Costo en dólares de cada producto del catálogo (agua + envase + tapa)
+        return costos_productos(self.productos, self.costos, self.costo_litro, self.sku_tapa)
+
+    @cached_property
+    def pendientes(self):
+        # Pedidos por entregar agrupados por cliente (sacado de "(Cliente: ...)"): {cliente: [pedido, ...]}
+        df_v, por_cliente = self.df_v, {}
+        if df_v.empty or 'Pendiente' not in df_v.columns: return por_cliente
+        for r in df_v[df_v['Pendiente']].to_dict('records'):
+            texto = r.get('Detalles_Compra', '')
+            cliente = cliente_de(texto) or "Sin nombre"
+            por_cliente.setdefault(cliente, []).append({"ID": r['ID'], "cliente": cliente, "items": renglones(texto), "registro": r})
+        return por_cliente
+
+    @cached_property
+    def resumen(self):
+        return self._resumen.actualizar(self.version, self.d_ventas, self.d_cargas, self.d_inv, self.productos, self.tasa)
+
+    @cached_property
+    def tasas(self):
+        # Tasa de cada día sacada de las filas (tasas.py), solo para los montos que no traían tasa; Ventas manda
+        return tabla_tasas([self.df_i, self.df_c, self.df_v_bruto], self.tasa)
+
+    @cached_property
+    def dias(self):
+        # Totales por día del resumen con los montos en Bs ya en dólares (a la tasa de cada fila)
+        return en_dolares(self.resumen.tabla(), self.tasas)
+
+    def totales(self, inicio=None, fin=None):
+        # Suma de `dias` en el rango (todo el histórico sin fechas): mismas claves que ResumenDiario más *_usd
+        return sumar(self.dias, inicio, fin)
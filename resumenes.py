@@ -0,0 +1,211 @@
+"""Resúmenes diarios materializados para DIARIO, BALANCE y CAJA GENERAL.
+
+Cada día guarda sus totales (montos y transacciones por método de pago, litros,
+agua, gastos, depósitos, compras de inventario, unidades por producto y ventas
+por hora para el mapa de calor). Los montos en Bs se pasan a dólares fila por fila
+con la Tasa_Cambio de la propia fila, así el total en dólares queda guardado en el
+día y sobrevive al archivo mensual; lo que no trae tasa queda en *_sin_tasa. Las
+filas nuevas se pliegan al llegar; las ventas que cambian (anulación, entrega,
+entrega parcial) se restan tal como estaban y se suman como quedaron. Un rango de
+fechas es la suma de unos pocos renglones diarios, no un barrido de tickets.
+"""
+import re
+import threading
+from collections import Counter, defaultdict
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from detalles import tabla_items
+from esquema import Metodo, metodo_de
+
+_RE_NO_CLIENTE = re.compile(r"Complemento Mixto|Vuelto", re.I)
+
+
+def _num(valor):
+    try: return float(valor)
+    except (TypeError, ValueError): return 0.0
+
+
+def _fecha(valor):
+    txt = str(valor).strip()
+    try: return datetime.strptime(txt[:10], "%Y-%m-%d").date()
+    except ValueError:
+        f = pd.to_datetime(txt, errors="coerce")
+        return None if pd.isna(f) else f.date()
+
+
+def _hora(valor):
+    try: h = int(str(valor).strip().split(":")[0])
+    except ValueError: return None
+    return h if 0 <= h < 24 else None
+
+
+def _estado(registro, col_estado):
+    # 'A' = anulada, 'P' = pendiente, '' = cualquier otra (activa, entregada...)
+    txt = str(registro.get(col_estado, "")).strip().upper() if col_estado else ""
+    return "A" if "ANULADA" in txt else ("P" if txt == "PENDIENTE" else "")
+
+
+def _sumar_bs(d, clave, bs, registro):
+    # Suma `bs` a clave_bs y, a la tasa de la fila, a clave_usd; sin tasa válida va a clave_sin_tasa (tasas.en_dolares)
+    d[f"{clave}_bs"] += bs
+    t = _num(registro.get("Tasa_Cambio"))
+    if t > 0: d[f"{clave}_usd"] += bs / t
+    else: d[f"{clave}_sin_tasa"] += bs
+
+
+def _cambiadas(actuales, vistas, tramo=1024):
+    # Posiciones de `vistas` (filas ya plegadas) que ya no son iguales en `actuales`. Se compara de a tramos en C
+    # (la igualdad de listas mira primero la identidad): un libro sin cambios no se recorre fila por fila en Python
+    for s in range(0, len(vistas), tramo):
+        if actuales[s:s + tramo] == vistas[s:s + tramo]: continue
+        for i in range(s, min(s + tramo, len(vistas))):
+            if actuales[i] is not vistas[i] and actuales[i] != vistas[i]: yield i
+
+
+def sumar(tabla, inicio=None, fin=None):
+    # Suma los renglones diarios entre dos fechas (inclusive) de una tabla por día
+    if tabla.empty: return pd.Series(dtype="float64")
+    if inicio is None and fin is None: return tabla.sum()
+    return tabla.loc[(tabla.index >= inicio) & (tabla.index <= fin)].sum()
+
+
+def _firma(registro):
+    return (registro.get("Fecha"), registro.get("Hora"), registro.get("Detalles_Compra", registro.get("Notas")))
+
+
+class ResumenDiario:
+    def __init__(self, base=None):
+        self.base = base  # archivo.Historico: días ya cerrados que no están en el libro vivo
+        self._lock = threading.Lock()
+        self._version = None
+        self._reiniciar()
+
+    def _reiniciar(self):
+        # Los días del archivo son el punto de partida; encima se pliegan las filas vivas
+        b = self.base
+        self.dias = defaultdict(Counter, {d: Counter(c) for d, c in b.dias.items()} if b else {})
+        self.productos = defaultdict(Counter, {d: Counter(c) for d, c in b.productos.items()} if b else {})
+        self.filas_dia = defaultdict(list)  # posiciones de las ventas de cada día en la hoja
+        self.horas = defaultdict(lambda: np.zeros((2, 24)), {d: a.copy() for d, a in b.horas.items()} if b else {})  # por día: [ventas, monto en Bs] de cada hora
+        self._estados, self._fechas_v = [], []
+        self._vistas = []  # cada venta tal como se plegó
+        self._n = {"Ventas": 0, "Cargas": 0, "Inventario": 0}
+        self._firmas = {}
+        self._tabla = None
+
+    # --- ACTUALIZACIÓN ---
+    def actualizar(self, version, ventas, cargas, inventario, productos, tasa):
+        with self._lock:
+            if self._version is not None and version <= self._version: return self  # versión ya plegada (o más vieja)
+            hojas = {"Ventas": ventas, "Cargas": cargas, "Inventario": inventario}
+            if any(len(r) < self._n[h] or (self._n[h] and _firma(r[self._n[h] - 1]) != self._firmas[h]) for h, r in hojas.items()):
+                self._reiniciar()  # se borraron o movieron filas: se reconstruye desde cero
+            col_estado = list(ventas[0].keys())[10] if ventas and len(ventas[0]) >= 11 else None
+
+            # Ventas ya plegadas que cambiaron (anulaciones, entregas, entregas parciales)
+            for i in _cambiadas(ventas, self._vistas):
+                self._plegar_ventas(self._vistas, i, i + 1, productos, col_estado, -1)
+                self._estados[i], self._vistas[i] = _estado(ventas[i], col_estado), ventas[i]
+                self._plegar_ventas(ventas, i, i + 1, productos, col_estado, +1)
+
+            self._plegar_ventas(ventas, self._n["Ventas"], len(ventas), productos, col_estado, +1, nuevas=True)
+            for r in cargas[self._n["Cargas"]:]: self._plegar_carga(r)
+            for r in inventario[self._n["Inventario"]:]: self._plegar_compra(r, tasa)
+
+            for h, r in hojas.items():
+                self._n[h] = len(r)
+                if r: self._firmas[h] = _firma(r[-1])
+            self._version = version
+            self._tabla = None
+            return self
+
+    def _plegar_ventas(self, ventas, desde, hasta, productos, col_estado, signo, nuevas=False):
+        if desde >= hasta: return
+        for i in range(desde, hasta):
+            r = ventas[i]
+            if nuevas:
+                self._estados.append(_estado(r, col_estado)); self._fechas_v.append(_fecha(r.get("Fecha"))); self._vistas.append(r)
+                if self._fechas_v[i]: self.filas_dia[self._fechas_v[i]].append(i)
+            dia = self._fechas_v[i]
+            if dia is None or self._estados[i] == "A": continue
+            d = self.dias[dia]
+            texto_metodo, det, monto = str(r.get("Metodo_Pago", "")), str(r.get("Detalles_Compra", "")), _num(r.get("Monto"))
+            metodo = metodo_de(texto_metodo)
+            if metodo != Metodo.OTRO:
+                clave = metodo.name.lower()
+                d[f"{clave}_monto"] += signo * monto
+                if "vuelto" not in det.lower(): d[f"{clave}_n"] += signo
+            if metodo != Metodo.DIVISA: _sumar_bs(d, "no_divisa", signo * monto, r)
+            # "Adelantado" = mercancía que se cobró en otra fila (lo pendiente de un cobro, cada entrega posterior):
+            # saca agua del tanque pero no es otro cliente ni otra venta del día
+            adelantado = texto_metodo.strip().lower() == "adelantado"
+            if not adelantado and not _RE_NO_CLIENTE.search(det): d["transacciones"] += signo
+            if self._estados[i] != "P": d["litros_vendidos"] += signo * _num(r.get("Total_Litros"))
+            if not adelantado: d["registros"] += signo
+            h = _hora(r.get("Hora"))
+            if h is not None:
+                usd = str(r.get("Moneda", "")).strip().upper() == "USD"
+                self.horas[dia][0, h] += signo
+                self.horas[dia][1, h] += signo * monto * ((_num(r.get("Tasa_Cambio")) or 1) if usd else 1)
+
+        # Unidades por producto: se desglosa solo el tramo tocado
+        tramo = pd.DataFrame(ventas[desde:hasta], index=range(desde, hasta))
+        items = tabla_items(tramo, productos)
+        dias = items["Fila"].map(lambda f: self._fechas_v[f - 2] if self._estados[f - 2] != "A" else None)
+        for (dia, prod), cant in items.groupby([dias, items["Producto"]])["Cantidad"].sum().items():
+            self.productos[dia][prod] += signo * int(cant)
+
+    def _plegar_carga(self, r):
+        dia = _fecha(r.get("Fecha"))
+        if dia is None: return
+        d = self.dias[dia]
+        concepto = str(r.get("Concepto", r.get("Notas", ""))).upper()
+        costo = _num(r.get("Costo_Bs", r.get("Costo_Divisa")))
+        if "DEPÓSITO" in concepto: _sumar_bs(d, "deposito", costo, r)
+        elif "GASTO" in concepto: _sumar_bs(d, "gasto", costo, r)
+        else: _sumar_bs(d, "agua", costo, r); d["litros_cargados"] += _num(r.get("Litros"))
+
+    def _plegar_compra(self, r, tasa):
+        dia = _fecha(r.get("Fecha"))
+        if dia is None: return
+        t = _num(r.get("Tasa_Cambio")) if str(r.get("Tasa_Cambio", "")).strip() else tasa
+        self.dias[dia]["inventario_usd"] += _num(r.get("Costo_Bs")) / (t or 1)
+
+    # --- CONSULTAS ---
+    # Todas leen bajo el mismo candado que actualizar(): otra sesión puede estar plegando filas nuevas
+    def tabla(self):
+        with self._lock:
+            if self._tabla is None:
+                self._tabla = pd.DataFrame.from_dict(self.dias, orient="index").fillna(0.0).sort_index()
+            return self._tabla  # no se modifica: actualizar() arma una nueva
+
+    def rango(self, inicio, fin):
+        return sumar(self.tabla(), inicio, fin)
+
+    def dia(self, fecha):
+        return self.rango(fecha, fecha)
+
+    def total(self):
+        return self.tabla().sum()
+
+    def mapa(self, inicio=None, fin=None):
+        # Arreglo 7 × 2 × 24: día de la semana (0 = lunes) × [ventas, monto en Bs] × hora, sumando los días del rango
+        total = np.zeros((7, 2, 24))
+        with self._lock:
+            for dia, arr in self.horas.items():
+                if (inicio is None or dia >= inicio) and (fin is None or dia <= fin): total[dia.weekday()] += arr
+        return total
+
+    def unidades(self, inicio, fin):
+        conteo = Counter()
+        with self._lock:
+            for dia, c in self.productos.items():
+                if inicio <= dia <= fin: conteo.update(c)
+        return pd.Series({p: q for p, q in conteo.items() if q > 0}, dtype="int64").sort_values(ascending=False)
+
+    def filas(self, fecha):
+        # Posiciones en la hoja de las ventas de un día
+        with self._lock: return list(self.filas_dia.get(fecha, ()))
@@ -0,0 +1,113 @@
+"""Espejo local de hojas de Google Sheets con sincronización incremental.
+
+En vez de bajar toda la hoja con get_all_records() en cada refresco, el espejo
+recuerda cuántas filas ya tiene y solo pide la cola nueva (más la columna de
+estado, si la hoja la tiene, para enterarse de anulaciones y entregas).
+
+Límite: de las filas que ya tiene solo se vuelve a mirar el estado. Lo que la app
+edita en otras columnas (detalle y litros de una entrega parcial) lo refleja
+fijar() al escribir; una edición hecha a mano en el libro sobre otra columna de
+una fila vieja se ve recién en la próxima recarga completa, cada
+resync_completo segundos (10 minutos por defecto).
+"""
+import threading
+import time
+
+from gspread.utils import numericise_all, rowcol_to_a1
+
+
+def letra_columna(col):
+    return rowcol_to_a1(1, col)[:-1]
+
+
+class EspejoHoja:
+    def __init__(self, nombre, col_estado=None, resync_completo=600):
+        self.nombre = nombre
+        self.col_estado = col_estado  # 1-based (K = 11 en Ventas)
+        self.resync_completo = resync_completo  # segundos entre recargas completas de seguridad
+        self.encabezados = []
+        self.filas = []
+        self.version = 0
+        self._registros = (None, [])  # (versión, lista): misma lista mientras no haya cambios
+        self._ultima_completa = 0.0
+        self.lock = threading.Lock()  # tomado durante cada sincronización (también las que van en lote con otras hojas)
+
+    # --- API PÚBLICA ---
+    def sincronizar(self, ws):
+        with self.lock:
+            rangos = self.rangos()
+            if rangos is None or not self.aplicar(ws.batch_get(rangos)): self.completo(ws.get_all_values())
+            return self.registros()
+
+    def rangos(self):
+        # Rangos A1 (sin el nombre de la hoja) que hay que pedir para ponerse al día; None = toca recarga completa.
+        # Se pide desde la última fila conocida (inclusive): sirve de control de que nadie borró ni movió filas
+        # por encima, y evita pedir un rango fuera de la grilla
+        if not self.encabezados or time.time() - self._ultima_completa > self.resync_completo: return None
+        rangos = [f"A{len(self.filas) + 1}:{letra_columna(len(self.encabezados))}"]
+        if self._con_estado():
+            le = letra_columna(self.col_estado)
+            rangos.append(f"{le}2:{le}")
+        return rangos
+
+    def fijar(self, fila, cambios):
+        # Refleja una edición ya escrita en la hoja (fila de la hoja, {columna 1-based: valor}):
+        # la sincronización incremental solo vigila la columna de estado
+        with self.lock:
+            i = fila - 2
+            if not 0 <= i < len(self.filas): return
+            nueva = list(self.filas[i])
+            for col, valor in cambios.items():
+                if col <= len(nueva): nueva[col - 1] = numericise_all([valor])[0] if isinstance(valor, str) else valor
+            self.filas[i] = nueva
+            self.version += 1
+
+    def registros(self):
+        if self._registros[0] != self.version:
+            self._registros = (self.version, [dict(zip(self.encabezados, f)) for f in self.filas])
+        return self._registros[1]
+
+    # --- CARGAS ---
+    def _normalizar(self, fila):
+        fila = numericise_all(list(fila))
+        faltan = len(self.encabezados) - len(fila)
+        return fila + [""] * faltan if faltan > 0 else fila[:len(self.encabezados)]
+
+    def _sin_estado(self, fila):
+        if not self.col_estado or len(fila) < self.col_estado: return fila
+        return fila[:self.col_estado - 1] + fila[self.col_estado:]
+
+    def _con_estado(self):
+        return bool(self.col_estado) and len(self.encabezados) >= self.col_estado
+
+    def completo(self, valores):
+        # Todas las filas de la hoja (títulos incluidos), como las da get_all_values()
+        self.encabezados = valores[0] if valores else []
+        self.filas = [self._normalizar(f) for f in valores[1:]]
+        self._ultima_completa = time.time()
+        self.version += 1
+
+    def aplicar(self, respuesta):
+        # Aplica la respuesta a rangos() (una lista de filas por rango); False si la hoja cambió y toca recarga completa
+        n = len(self.filas)
+        con_estado = self._con_estado()
+        cola = list(respuesta[0])
+        if not cola: return False
+        if n: coincide = self._sin_estado(self._normalizar(cola[0])) == self._sin_estado(self.filas[-1])
+        else: coincide = list(cola[0]) == self.encabezados
+        if not coincide: return False  # la hoja cambió por encima de la cola: toca recarga completa
+
+        cambios = False
+        if con_estado and n:
+            i_est = self.col_estado - 1
+            estados = [numericise_all(list(c))[0] if c else "" for c in respuesta[1]]
+            for i, fila in enumerate(self.filas):
+                nuevo = estados[i] if i < len(estados) else ""
+                if fila[i_est] != nuevo:
+                    fila[i_est] = nuevo; cambios = True
+
+        nuevas = [self._normalizar(f) for f in cola[1:]]
+        if nuevas:
+            self.filas.extend(nuevas); cambios = True
+        if cambios: self.version += 1
+        return True
@@ -0,0 +1,127 @@
+"""Libro del tanque: entradas (Cargas) y salidas (Ventas) de agua ordenadas por fecha y hora.
+
+El nivel actual es un acumulado que se mantiene al llegar cada fila, así que
+leerlo no recorre nada. Cada BLOQUE movimientos se guarda un punto de control
+con el nivel acumulado; el nivel a cualquier hora pasada se obtiene con una
+búsqueda binaria y sumando como mucho un bloque (sirve para cuadrar las
+calibraciones contra lo que decía el sistema en ese momento).
+
+Las filas nuevas se pasan a movimientos en bloque (fechas y litros por columna)
+y se ordenan una sola vez; los puntos de control se rehacen en una pasada desde
+el primer movimiento que cayó antes del final. Una versión nueva solo toca las
+filas agregadas y las ventas que cambiaron.
+"""
+import threading
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+from esquema import FORMATO_FECHA, FORMATO_HORA, fechas, horas
+from resumenes import _cambiadas, _estado, _firma, _num
+
+BLOQUE = 256
+
+
+def _columna(registros, campo):
+    return pd.Series([r.get(campo, "") for r in registros], dtype=object)
+
+
+def _momentos(registros):
+    # Momento de cada registro en nanosegundos; sin fecha queda en el mínimo (cuenta desde siempre)
+    if not registros: return np.empty(0, dtype="int64")
+    fecha, hora = (_columna(registros, c).astype(str).str.strip() for c in ("Fecha", "Hora"))
+    momentos = pd.to_datetime(fecha.str.slice(0, 10) + " " + hora, format=f"{FORMATO_FECHA} {FORMATO_HORA}", errors="coerce")
+    raras = momentos.isna()
+    # Fecha escrita a mano en otro formato, o sin hora válida (cuenta desde el comienzo del día)
+    if raras.any(): momentos[raras] = fechas(fecha[raras]) + horas(hora[raras]).fillna(pd.Timedelta(0))
+    return momentos.to_numpy("datetime64[ns]").view("int64")
+
+
+def _litros(registros, campo):
+    return pd.to_numeric(_columna(registros, campo), errors="coerce").fillna(0.0).to_numpy(float)
+
+
+def _cuentan(registros, col_estado):
+    # Igual que calcular_stock: pendientes y anuladas no han sacado agua del tanque (mismo texto que _estado)
+    if not col_estado: return np.ones(len(registros), dtype=bool)
+    codigos, valores = pd.factorize(_columna(registros, col_estado))  # unos pocos estados distintos
+    return np.array([_estado({col_estado: v}, col_estado) == "" for v in valores] + [True], dtype=bool)[codigos]
+
+
+class LibroTanque:
+    def __init__(self, bloque=BLOQUE, inicial=0.0):
+        self.bloque = bloque
+        self.inicial = inicial  # litros con los que arranca el libro vivo (lo que dejó el archivo)
+        self._lock = threading.Lock()
+        self._version = None
+        self._reiniciar()
+
+    def _reiniciar(self):
+        self.momentos, self.deltas = [], []  # movimientos ordenados por momento (en nanosegundos)
+        self.puntos = [self.inicial]  # puntos[k] = nivel acumulado de los primeros k * bloque movimientos
+        self.nivel = self.inicial
+        self._vistas = []  # cada venta tal como se plegó
+        self._ventas = []  # por venta plegada: (momento, litros que sacó del tanque)
+        self._n = {"Cargas": 0, "Ventas": 0}
+        self._firmas = {}
+
+    # --- ACTUALIZACIÓN ---
+    def actualizar(self, version, cargas, ventas):
+        with self._lock:
+            if self._version is not None and version <= self._version: return self
+            hojas = {"Cargas": cargas, "Ventas": ventas}
+            if any(len(r) < self._n[h] or (self._n[h] and _firma(r[self._n[h] - 1]) != self._firmas[h]) for h, r in hojas.items()):
+                self._reiniciar()
+            col_estado = list(ventas[0].keys())[10] if ventas and len(ventas[0]) >= 11 else None
+
+            # Ventas ya plegadas que cambiaron de estado o de litros: el ajuste se asienta en el momento de la venta
+            ajustes = []
+            for i in _cambiadas(ventas, self._vistas):
+                momento, sacado = self._ventas[i]
+                ahora = _num(ventas[i].get("Total_Litros")) if _estado(ventas[i], col_estado) == "" else 0.0
+                if ahora != sacado: ajustes.append((momento, sacado - ahora))
+                self._ventas[i], self._vistas[i] = (momento, ahora), ventas[i]
+
+            nuevas_c, nuevas_v = cargas[self._n["Cargas"]:], ventas[self._n["Ventas"]:]
+            m_v, sacado = _momentos(nuevas_v), _litros(nuevas_v, "Total_Litros") * _cuentan(nuevas_v, col_estado)
+            self._ventas += zip(m_v.tolist(), sacado.tolist())
+            self._vistas += nuevas_v
+            self._asentar(np.concatenate([_momentos(nuevas_c), m_v, np.array([m for m, _ in ajustes], dtype="int64")]),
+                          np.concatenate([_litros(nuevas_c, "Litros"), -sacado, np.array([d for _, d in ajustes], dtype=float)]))
+
+            for h, r in hojas.items():
+                self._n[h] = len(r)
+                if r: self._firmas[h] = _firma(r[-1])
+            self._version = version
+            return self
+
+    def _asentar(self, momentos, deltas):
+        hay = deltas != 0
+        momentos, deltas = momentos[hay], deltas[hay]
+        if not len(deltas): return
+        self.nivel += float(deltas.sum())
+        # Los que caen antes del último movimiento (cargas atrasadas, ajustes) se intercalan uno por uno;
+        # el resto se ordena una vez y va al final
+        tarde = momentos < self.momentos[-1] if self.momentos else np.zeros(len(momentos), dtype=bool)
+        desde = len(self.deltas)
+        for m, d in zip(momentos[tarde].tolist(), deltas[tarde].tolist()):
+            i = bisect_right(self.momentos, m)
+            self.momentos.insert(i, m); self.deltas.insert(i, d)
+            desde = min(desde, i)
+        orden = np.argsort(momentos[~tarde], kind="stable")
+        self.momentos += momentos[~tarde][orden].tolist(); self.deltas += deltas[~tarde][orden].tolist()
+        # Una pasada por los puntos de control desde el bloque del primer movimiento tocado
+        b = self.bloque
+        del self.puntos[desde // b + 1:]
+        for k in range(len(self.puntos), len(self.deltas) // b + 1):
+            self.puntos.append(self.puntos[-1] + sum(self.deltas[(k - 1) * b:k * b]))
+
+    # --- CONSULTAS ---
+    def nivel_en(self, momento):
+        # Litros en el tanque al cierre de `momento` (datetime)
+        m = pd.Timestamp(momento).value
+        with self._lock:
+            i = bisect_right(self.momentos, m)
+            k = i // self.bloque
+            return self.puntos[k] + sum(self.deltas[k * self.bloque:i])
@@ -0,0 +1,43 @@
+"""Tasa de cambio de cada día, para llevar a dólares los montos en Bs de cualquier fecha.
+
+Cada fila de Ventas, Cargas e Inventario guarda la tasa con que se registró
+(Tasa_Cambio), que es la TASA_DIA vigente en ese momento: la historia de la tasa
+ya está en las hojas. La tabla toma, por día, la última tasa registrada (la de
+Ventas si ese día hubo ventas). Un día sin filas usa la última tasa anterior
+conocida y los días previos a la primera usan la primera; sin ninguna fila vale
+TASA_DIA. Los montos de las filas con tasa ya llegan en dólares en el resumen
+diario (resumenes._sumar_bs); la tabla solo pasa lo que quedó sin tasa, con una
+operación de columna sobre la tabla de días.
+"""
+import numpy as np
+import pandas as pd
+
+
+def tabla_tasas(marcos, tasa):
+    """Serie fecha (datetime64[D]) -> Bs por dólar, ordenada. `marcos` = DataFrames tipados con FechaDT y Tasa_Cambio,
+    de menor a mayor prioridad (el último que tenga filas en un día manda ese día)."""
+    partes = [m[['FechaDT', 'Tasa_Cambio']] for m in marcos if not m.empty and {'FechaDT', 'Tasa_Cambio'} <= set(m.columns)]
+    filas = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame(columns=['FechaDT', 'Tasa_Cambio'])
+    filas = filas[filas['FechaDT'].notna() & (filas['Tasa_Cambio'] > 0)]
+    if filas.empty: return pd.Series([float(tasa)], index=np.array(['1970-01-01'], dtype='datetime64[D]'))
+    dias = filas['FechaDT'].values.astype('datetime64[D]')
+    # groupby conserva el orden de las filas: en cada día gana la última del marco de más prioridad
+    return filas['Tasa_Cambio'].astype(float).groupby(dias, sort=True).last()
+
+
+def tasas_en(tabla, dias):
+    # Tasa vigente (as-of) en cada día de `dias`
+    dias = np.asarray(pd.to_datetime(pd.Index(dias)).values.astype('datetime64[D]'))
+    pos = np.searchsorted(tabla.index.values.astype('datetime64[D]'), dias, side='right') - 1
+    return tabla.values[np.clip(pos, 0, len(tabla) - 1)]
+
+
+def en_dolares(dias, tabla):
+    """Totales por día (ResumenDiario.tabla()) con la tasa del día; a los *_usd de cada fila se suma lo que no traía tasa."""
+    if dias.empty: return dias
+    dias = dias.copy()
+    dias['tasa'] = tasas_en(tabla, dias.index)
+    for clave in ('no_divisa', 'agua', 'gasto', 'deposito'):
+        dias[clave + '_usd'] = dias.get(clave + '_usd', 0.0) + dias.get(clave + '_sin_tasa', 0.0) / dias['tasa']
+    dias['ventas_usd'] = dias.get('divisa_monto', 0.0) + dias['no_divisa_usd']
+    return dias
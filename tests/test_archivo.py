@@ -0,0 +1,33 @@
+"""Archivar meses cerrados no debe cambiar los totales de BALANCE ni de CAJA GENERAL."""
+import pandas as pd
+
+from almacen import AlmacenSQLite
+from archivo import Archivo, archivar
+from benchmarks.generador import generar
+from modelo import Modelo
+from resumenes import ResumenDiario
+from tanque import LibroTanque
+
+HOJAS = ("Productos", "Configuracion", "Cargas", "Ventas", "Inventario")
+
+
+def _modelo(almacen, historico=None):
+    crudos = tuple(almacen.leer(h) for h in HOJAS)
+    return Modelo((1,), crudos, resumen=ResumenDiario(base=historico),
+                  tanque=LibroTanque(inicial=historico.tanque if historico else 0.0), historico=historico)
+
+
+def test_archivar_conserva_totales(tmp_path):
+    almacen = AlmacenSQLite(str(tmp_path / "agua.db"))
+    for hoja, registros in zip(HOJAS, generar(6000, por_dia=60)): almacen.importar(hoja, registros)
+    antes = _modelo(almacen)
+    ref_total, ref_dias = antes.totales(), antes.dias.copy()
+
+    archivo = Archivo(str(tmp_path / "archivo"))
+    archivar(almacen, archivo, "2024-03")
+    assert archivo.meses("Ventas") == ["2024-01", "2024-02"]
+    despues = _modelo(almacen, archivo.historico(*antes.maestros))
+
+    claves = ["ventas_usd", "no_divisa_usd", "agua_usd", "gasto_usd", "deposito_usd", "inventario_usd", "no_divisa_bs", "transacciones"]
+    pd.testing.assert_series_equal(ref_total[claves], despues.totales()[claves], check_exact=False, rtol=1e-9)
+    pd.testing.assert_series_equal(ref_dias["ventas_usd"], despues.dias["ventas_usd"], check_exact=False, rtol=1e-9)
@@ -0,0 +1,20 @@
+"""El libro del tanque armado por partes da lo mismo que armado de una vez."""
+from datetime import datetime
+
+from benchmarks.generador import generar
+from tanque import LibroTanque
+
+
+def test_incremental_igual_a_completo():
+    _, _, cargas, ventas, _ = generar(3000)
+    col_estado = list(ventas[0].keys())[10]
+    libro = LibroTanque(bloque=32).actualizar((1,), cargas, ventas[:2000])
+    ventas = list(ventas)
+    ventas[10] = dict(ventas[10], **{col_estado: "ANULADA"})  # anulación de una venta vieja
+    ventas[20] = dict(ventas[20], Total_Litros=0)
+    libro.actualizar((2,), cargas, ventas)
+    completo = LibroTanque(bloque=32).actualizar((1,), cargas, ventas)
+    assert abs(libro.nivel - completo.nivel) < 1e-6
+    for momento in (datetime(2023, 12, 31), datetime(2024, 1, 1, 9), datetime(2024, 1, 10, 15, 30), datetime(2030, 1, 1)):
+        assert abs(libro.nivel_en(momento) - completo.nivel_en(momento)) < 1e-6
+    assert abs(completo.nivel_en(datetime(2030, 1, 1)) - completo.nivel) < 1e-6